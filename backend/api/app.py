@@ -1,30 +1,68 @@
 import os
-from flask import Flask, jsonify
+import time
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from .metrics import registry, REQUEST_SECONDS
+from .profiling import init_profiling
+
 load_dotenv()
 
 def create_app():
     app = Flask(__name__)
-    
+
     # CORS configuration
     CORS(app, resources={
         r"/api/*": {
             "origins": os.getenv('FRONTEND_URL', 'http://localhost:5173'),
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization", "X-User-ID"]
+            "allow_headers": ["Content-Type", "Authorization", "X-User-ID", "X-Playhead"],
+            "expose_headers": ["Retry-After"]
         }
     })
-    
+
+    # Ensure storage directories exist (local mkdir only, no network)
+    from .utils import ensure_directories
+    ensure_directories()
+
     # Import and register blueprints
     from .routes import api
     app.register_blueprint(api, url_prefix='/api')
-    
+
+    # Inline mode: pick up videos the storage reaper requeued
+    from .pipeline import PROCESSING_MODE, start_requeue_poller
+    if PROCESSING_MODE != 'queue':
+        start_requeue_poller()
+
+    # Request latency metrics
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    # Opt-in per-request profiling (X-Profile header)
+    init_profiling(app)
+
     # Health check endpoint
     @app.route('/health')
     def health():
         return jsonify({'status': 'healthy', 'service': 'StreamSwarm API'})
-    
-    return app
 
+    # Prometheus metrics endpoint
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
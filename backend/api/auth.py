@@ -0,0 +1,184 @@
+"""
+Authentication helpers for StreamSwarm API
+
+- Stateless session tokens: HS256 JWTs signed with JWT_SECRET_KEY and
+  verified without a database round-trip.
+- A small TTL cache for the legacy `X-User-ID` header lookups.
+- bcrypt hashing on a bounded thread pool, so a login storm queues behind
+  a few workers (or is rejected) instead of occupying every request worker.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_TTL = int(os.getenv('SESSION_TTL_SECONDS', 7 * 24 * 3600))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', 2))
+# Requests allowed to wait on the pool at once. Each one holds a request
+# thread, so keep this well below the server's thread count (e.g. gunicorn
+# --threads) or a login storm can still occupy every thread.
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', BCRYPT_WORKERS * 2))
+# Longest a request waits for its hash before giving up with 503
+BCRYPT_WAIT_SECONDS = float(os.getenv('BCRYPT_WAIT_SECONDS', 5))
+
+
+def _load_secret():
+    secret = os.getenv('JWT_SECRET_KEY')
+    if not secret:
+        print("⚠️  JWT_SECRET_KEY not set; using a random per-process key (tokens won't survive restarts)")
+        return secrets.token_bytes(32)
+    if secret == 'your-secret-key-change-this-in-production':
+        print("⚠️  JWT_SECRET_KEY is the default placeholder; change it in production")
+    return secret.encode('utf-8')
+
+
+_SECRET = _load_secret()
+_TOKEN_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+
+
+class AuthBusyError(Exception):
+    """Raised when too many password hashing jobs are already pending"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def _sign(signing_input):
+    return _b64encode(hmac.new(_SECRET, signing_input, hashlib.sha256).digest())
+
+
+def create_session_token(user, ttl=SESSION_TTL):
+    """
+    Create a signed session token for a user document
+
+    Returns:
+        str: JWT carrying user_id (sub), username and email
+    """
+    now = int(time.time())
+    payload = {
+        'sub': str(user['_id']),
+        'username': user['username'],
+        'email': user['email'],
+        'iat': now,
+        'exp': now + ttl
+    }
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    signing_input = _TOKEN_HEADER + b'.' + body
+    return (signing_input + b'.' + _sign(signing_input)).decode('ascii')
+
+
+def verify_session_token(token):
+    """
+    Verify a session token without touching the database
+
+    Returns:
+        dict: Token claims, or None if the token is malformed, forged or expired
+    """
+    try:
+        header, body, signature = token.encode('ascii').split(b'.')
+    except (UnicodeEncodeError, ValueError):
+        return None
+    if header != _TOKEN_HEADER:
+        return None
+    if not hmac.compare_digest(signature, _sign(header + b'.' + body)):
+        return None
+    try:
+        claims = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get('exp', 0) < time.time():
+        return None
+    return claims
+
+
+class TTLCache:
+    """Thread-safe dict with per-entry expiry and a size bound"""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+user_cache = TTLCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+_password_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_password_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+
+def _run_bounded(fn, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise AuthBusyError('Too many concurrent authentication requests')
+    try:
+        future = _password_executor.submit(fn, *args)
+    except BaseException:
+        _password_slots.release()
+        raise
+    # The slot is held until the hash finishes, even if the caller stops
+    # waiting, so abandoned work still counts against the bound
+    future.add_done_callback(lambda _: _password_slots.release())
+    try:
+        return future.result(timeout=BCRYPT_WAIT_SECONDS)
+    except FutureTimeoutError:
+        future.cancel()
+        raise AuthBusyError('Timed out waiting for the password hashing pool')
+
+
+def _hashpw(password):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _checkpw(password, password_hash):
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def hash_password(password):
+    """Hash a password using bcrypt on the bounded executor"""
+    return _run_bounded(_hashpw, password)
+
+
+def verify_password(password, password_hash):
+    """Verify a password against a hash on the bounded executor"""
+    return _run_bounded(_checkpw, password, password_hash)
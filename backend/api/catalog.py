@@ -0,0 +1,269 @@
+"""
+In-memory video catalog snapshot for /api/videos
+
+Each video document is serialized to JSON once, when it first appears or
+changes, and kept in memory along with sort/filter indexes (newest first,
+by status, by user). Pages are assembled by joining pre-encoded bytes and
+cached with a content ETag until the catalog changes, so a page view costs
+no database query and no per-video Python work.
+
+Freshness: local writes (save_video / update_video_status) mark the
+snapshot dirty, and every CATALOG_REFRESH_SECONDS the snapshot pulls only
+documents whose updated_at moved past its watermark, which also picks up
+writes from other API nodes and split workers. updated_at comes from each
+writer's clock and writes can commit out of order, so every refresh
+re-reads CATALOG_REFRESH_OVERLAP_SECONDS before the watermark. Local
+deletions are applied immediately; a full reload every
+CATALOG_FULL_RELOAD_SECONDS catches deletions made by other processes
+(e.g. `manage.py reap`) and anything later than the overlap.
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .database import db
+
+REFRESH_SECONDS = float(os.getenv('CATALOG_REFRESH_SECONDS', 1))
+FULL_RELOAD_SECONDS = float(os.getenv('CATALOG_FULL_RELOAD_SECONDS', 300))
+REFRESH_OVERLAP_SECONDS = float(os.getenv('CATALOG_REFRESH_OVERLAP_SECONDS', 10))
+PAGE_CACHE_SIZE = int(os.getenv('CATALOG_PAGE_CACHE_SIZE', 256))
+
+
+# Storage details never published: a duplicate upload's file name and
+# source_video_id point at another user's video, and content hashes would
+# let anyone test who has uploaded a given file
+PRIVATE_VIDEO_FIELDS = ('filename', 'sha256', 'source_video_id')
+
+
+def serialize_video(video):
+    """Convert a video document to JSON-safe types (as the API returns it)"""
+    video = {key: value for key, value in video.items() if key not in PRIVATE_VIDEO_FIELDS}
+    video['_id'] = str(video['_id'])
+    for key, value in video.items():
+        if isinstance(value, datetime):
+            video[key] = value.isoformat()
+    return video
+
+
+class _Entry:
+    __slots__ = ('key', 'status', 'user_id', 'encoded')
+
+    def __init__(self, key, status, user_id, encoded):
+        self.key = key
+        self.status = status
+        self.user_id = user_id
+        self.encoded = encoded
+
+
+class CatalogSnapshot:
+    """Pre-encoded, incrementally maintained view of the videos collection"""
+
+    def __init__(self, database=db):
+        self.db = database
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._entries = {}        # video_id -> _Entry
+        self._order = []          # sort keys, newest first
+        self._by_status = {}      # status -> sort keys
+        self._by_user = {}        # user_id -> sort keys
+        self._pages = {}          # query -> (body, etag), valid for this version
+        self._watermark = None
+        self._loaded = False
+        self._dirty = False
+        self._last_refresh = 0.0
+        self._last_full_reload = 0.0
+
+    # Maintenance
+    def mark_dirty(self, video_id=None, deleted=False):
+        """Called on local writes so the next read refreshes immediately"""
+        if deleted and video_id is not None:
+            # Incremental refreshes can't see deletions; drop it right away
+            self._forget(video_id)
+        self._dirty = True
+
+    def _forget(self, video_id):
+        with self._lock:
+            entry = self._entries.pop(video_id, None)
+            if entry is None:
+                return
+            self._remove(self._order, entry.key)
+            self._remove(self._by_status.get(entry.status, []), entry.key)
+            self._remove(self._by_user.get(entry.user_id, []), entry.key)
+            self._pages = {}
+
+    def _sort_key(self, video):
+        created_at = video.get('created_at')
+        timestamp = created_at.timestamp() if isinstance(created_at, datetime) else 0.0
+        # Newest first; video_id keeps the order total and stable
+        return (-timestamp, video['video_id'])
+
+    @staticmethod
+    def _insert(index, key):
+        position = bisect.bisect_left(index, key)
+        if position == len(index) or index[position] != key:
+            index.insert(position, key)
+
+    @staticmethod
+    def _remove(index, key):
+        position = bisect.bisect_left(index, key)
+        if position < len(index) and index[position] == key:
+            del index[position]
+
+    def _apply(self, video, update_indexes=True):
+        """Insert or update one document; caller holds self._lock"""
+        video_id = video['video_id']
+        old = self._entries.get(video_id)
+        key = old.key if old else self._sort_key(video)
+        entry = _Entry(
+            key,
+            video.get('status'),
+            video.get('user_id'),
+            json.dumps(serialize_video(video), sort_keys=True, separators=(',', ':')).encode('utf-8')
+        )
+        self._entries[video_id] = entry
+
+        if update_indexes:
+            if old is None:
+                self._insert(self._order, key)
+            else:
+                if old.status != entry.status:
+                    self._remove(self._by_status.get(old.status, []), key)
+                if old.user_id != entry.user_id:
+                    self._remove(self._by_user.get(old.user_id, []), key)
+            self._insert(self._by_status.setdefault(entry.status, []), key)
+            if entry.user_id is not None:
+                self._insert(self._by_user.setdefault(entry.user_id, []), key)
+
+        updated_at = video.get('updated_at') or video.get('created_at')
+        if isinstance(updated_at, datetime) and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    def _full_reload(self):
+        videos = list(self.db.videos.find())
+        with self._lock:
+            self._entries = {}
+            self._order = []
+            self._by_status = {}
+            self._by_user = {}
+            self._watermark = None
+            for video in videos:
+                self._apply(video, update_indexes=False)
+            # Build the indexes with one sort instead of N sorted inserts
+            for entry in sorted(self._entries.values(), key=lambda e: e.key):
+                self._order.append(entry.key)
+                self._by_status.setdefault(entry.status, []).append(entry.key)
+                if entry.user_id is not None:
+                    self._by_user.setdefault(entry.user_id, []).append(entry.key)
+            self._pages = {}
+            self._loaded = True
+
+    def _incremental_refresh(self):
+        query = {}
+        if self._watermark is not None:
+            # Re-read an overlap: a write stamped before the watermark may
+            # commit after it (slow writer, or a node whose clock is behind)
+            since = self._watermark - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+            query = {'updated_at': {'$gte': since}}
+        videos = list(self.db.videos.find(query))
+        if not videos:
+            return
+        with self._lock:
+            changed = False
+            for video in videos:
+                old = self._entries.get(video['video_id'])
+                self._apply(video)
+                changed = changed or old is None or old.encoded != self._entries[video['video_id']].encoded
+            if changed:
+                self._pages = {}
+
+    def refresh(self, force=False):
+        """Bring the snapshot up to date if it is due (or forced)"""
+        now = time.monotonic()
+        if not self._loaded:
+            # First load blocks every reader until the catalog exists
+            with self._refresh_lock:
+                if not self._loaded:
+                    self._full_reload()
+                    self._last_refresh = self._last_full_reload = time.monotonic()
+            return
+
+        due = force or self._dirty or now - self._last_refresh >= REFRESH_SECONDS
+        if not due or not self._refresh_lock.acquire(blocking=False):
+            # Someone else is refreshing; serve the current snapshot
+            return
+        try:
+            self._dirty = False
+            if now - self._last_full_reload >= FULL_RELOAD_SECONDS:
+                self._full_reload()
+                self._last_full_reload = now
+            else:
+                self._incremental_refresh()
+            self._last_refresh = now
+        except Exception as e:
+            self._dirty = True
+            print(f"⚠️  Catalog refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    # Reads
+    def get_page(self, status=None, user_id=None, sort='newest', page=None, per_page=50):
+        """
+        Return a pre-encoded page of the catalog
+
+        Args:
+            status (str): Only videos with this status
+            user_id (str): Only videos uploaded by this user
+            sort (str): 'newest' (default) or 'oldest'
+            page (int): 1-based page number, or None for the whole list
+            per_page (int): Page size when page is given
+
+        Returns:
+            tuple: (body bytes, etag)
+        """
+        self.refresh()
+        query = (status, user_id, sort, page, per_page)
+        with self._lock:
+            cached = self._pages.get(query)
+            if cached is not None:
+                return cached
+
+            if status is not None and user_id is not None:
+                user_keys = set(self._by_user.get(user_id, []))
+                keys = [key for key in self._by_status.get(status, []) if key in user_keys]
+            elif status is not None:
+                keys = self._by_status.get(status, [])
+            elif user_id is not None:
+                keys = self._by_user.get(user_id, [])
+            else:
+                keys = self._order
+
+            total = len(keys)
+            if page is not None:
+                if sort == 'oldest':
+                    start = max(total - page * per_page, 0)
+                    end = max(total - (page - 1) * per_page, 0)
+                    keys = keys[start:end][::-1]
+                else:
+                    keys = keys[(page - 1) * per_page:page * per_page]
+            elif sort == 'oldest':
+                keys = keys[::-1]
+
+            items = b','.join(self._entries[key[1]].encoded for key in keys)
+            body = b'{"videos":[' + items + b']'
+            if page is not None:
+                body += f',"page":{page},"per_page":{per_page},"total":{total}'.encode('utf-8')
+            body += b'}'
+
+            etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+            if len(self._pages) >= PAGE_CACHE_SIZE:
+                self._pages.pop(next(iter(self._pages)))
+            self._pages[query] = (body, etag)
+            return body, etag
+
+
+catalog = CatalogSnapshot()
+db.add_video_listener(catalog.mark_dirty)
@@ -1,25 +1,89 @@
 import os
-from pymongo import MongoClient
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class MongoDB:
+    """
+    MongoDB access layer
+
+    Construction is free: pymongo is imported and the client created on
+    first use, and the client itself connects in the background on its
+    first operation. Indexes are not created here; run
+    `python manage.py init` once per deployment (see ensure_indexes).
+    """
     def __init__(self):
-        self.client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
-        self.db = self.client[os.getenv('MONGODB_DB', 'streamswarm')]
-        
-        # Collections
-        self.videos = self.db.videos
-        self.chunks = self.db.chunks
-        self.users = self.db.users
-        
-        # Create indexes
+        self.uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
+        self.db_name = os.getenv('MONGODB_DB', 'streamswarm')
+        self._client = None
+        self._lock = threading.Lock()
+        self._video_listeners = []
+    
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from pymongo import MongoClient
+                    # connect=False: no I/O or monitor threads until first use,
+                    # which also keeps the client safe across pre-fork
+                    self._client = MongoClient(self.uri, connect=False)
+        return self._client
+    
+    @property
+    def db(self):
+        return self.client[self.db_name]
+    
+    # Collections
+    @property
+    def videos(self):
+        return self.db.videos
+    
+    @property
+    def chunks(self):
+        return self.db.chunks
+    
+    @property
+    def users(self):
+        return self.db.users
+    
+    @property
+    def jobs(self):
+        return self.db.jobs
+    
+    @property
+    def fingerprints(self):
+        return self.db.fingerprints
+    
+    def add_video_listener(self, listener):
+        """
+        Register listener(video_id, deleted=False), called after this
+        process writes or deletes a video
+        """
+        self._video_listeners.append(listener)
+    
+    def _notify_video(self, video_id, deleted=False):
+        for listener in self._video_listeners:
+            listener(video_id, deleted=deleted)
+    
+    def ensure_indexes(self):
+        """Create indexes (idempotent; run once per deployment)"""
         self.videos.create_index('video_id', unique=True)
+        self.videos.create_index('updated_at')
+        self.videos.create_index('source_video_id', sparse=True)
+        self.videos.create_index([('status', 1), ('requeued', 1)])
+        self.videos.create_index([('sha256', 1), ('user_id', 1)])
         self.chunks.create_index([('video_id', 1), ('chunk_id', 1)])
         self.users.create_index('email', unique=True)
         self.users.create_index('username', unique=True)
+        self.jobs.create_index([('status', 1), ('created_at', 1)])
+        self.jobs.create_index([('status', 1), ('lease_expires_at', 1)])
+        self.jobs.create_index('video_id')
+        self.fingerprints.create_index('sha256', unique=True)
+        self.fingerprints.create_index('partial')
+        self.fingerprints.create_index('video_id')
         
     def save_video(self, video_data):
         """
@@ -36,16 +100,21 @@ class MongoDB:
             }
         """
         video_data['created_at'] = datetime.utcnow()
-        return self.videos.insert_one(video_data)
+        video_data['updated_at'] = video_data['created_at']
+        result = self.videos.insert_one(video_data)
+        self._notify_video(video_data['video_id'])
+        return result
     
     def update_video_status(self, video_id, status, **kwargs):
         """Update video processing status"""
         update_data = {'status': status, 'updated_at': datetime.utcnow()}
         update_data.update(kwargs)
-        return self.videos.update_one(
+        result = self.videos.update_one(
             {'video_id': video_id},
             {'$set': update_data}
         )
+        self._notify_video(video_id)
+        return result
     
     def get_video(self, video_id):
         """Get video by ID"""
@@ -55,6 +124,75 @@ class MongoDB:
         """Get all videos"""
         return list(self.videos.find().sort('created_at', -1))
     
+    def find_user_video_by_hash(self, sha256, user_id):
+        """Get a user's video (not failed) whose upload had this content hash"""
+        return self.videos.find_one({'sha256': sha256, 'user_id': user_id, 'status': {'$ne': 'failed'}})
+    
+    def update_linked_videos(self, source_video_id, status, **kwargs):
+        """Mirror a source video's status onto duplicate uploads linked to it"""
+        linked = [v['video_id'] for v in self.videos.find({'source_video_id': source_video_id}, {'video_id': 1})]
+        if not linked:
+            return
+        update_data = {'status': status, 'updated_at': datetime.utcnow()}
+        update_data.update(kwargs)
+        self.videos.update_many({'source_video_id': source_video_id}, {'$set': update_data})
+        for video_id in linked:
+            self._notify_video(video_id)
+    
+    def rename_video_upload(self, video_id, filename):
+        """Point a video, and its queued or running job, at a new upload file"""
+        self.videos.update_one({'video_id': video_id}, {'$set': {'filename': filename}})
+        self.jobs.update_many(
+            {'video_id': video_id, 'status': {'$in': ['queued', 'running']}},
+            {'$set': {'filename': filename}}
+        )
+    
+    def touch_video(self, video_id):
+        """Record that a video is still being processed (inline mode heartbeat)"""
+        return self.videos.update_one({'video_id': video_id}, {'$set': {'heartbeat_at': datetime.utcnow()}})
+    
+    def claim_requeued_video(self):
+        """
+        Atomically take one video the storage reaper requeued for inline processing
+        
+        Returns:
+            dict: The claimed video, now 'processing', or None
+        """
+        from pymongo import ReturnDocument
+        now = datetime.utcnow()
+        video = self.videos.find_one_and_update(
+            {'status': 'uploaded', 'requeued': True},
+            {'$set': {'status': 'processing', 'requeued': False, 'heartbeat_at': now, 'updated_at': now}},
+            sort=[('updated_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if video:
+            self._notify_video(video['video_id'])
+        return video
+    
+    def get_video_states(self):
+        """Get the fields storage reconciliation needs for every video"""
+        return list(self.videos.find({}, {
+            '_id': 0,
+            'video_id': 1,
+            'filename': 1,
+            'status': 1,
+            'updated_at': 1,
+            'requeues': 1,
+            'requeued': 1,
+            'heartbeat_at': 1,
+            'source_video_id': 1
+        }))
+    
+    def delete_video(self, video_id):
+        """Delete a video with its chunk metadata, fingerprints and jobs"""
+        self.chunks.delete_many({'video_id': video_id})
+        self.fingerprints.delete_many({'video_id': video_id})
+        self.jobs.delete_many({'video_id': video_id})
+        result = self.videos.delete_one({'video_id': video_id})
+        self._notify_video(video_id, deleted=True)
+        return result
+    
     def save_chunks(self, video_id, chunks_data):
         """
         Save chunk metadata
@@ -72,6 +210,154 @@ class MongoDB:
         """Get all chunks for a video"""
         return list(self.chunks.find({'video_id': video_id}).sort('chunk_id', 1))
     
+    def delete_chunks(self, video_id):
+        """Delete all chunk metadata for a video"""
+        return self.chunks.delete_many({'video_id': video_id})
+    
+    # Upload content fingerprints (duplicate detection)
+    def find_fingerprints(self, partial):
+        """Get fingerprints whose partial (size + head + tail) hash matches"""
+        return list(self.fingerprints.find({'partial': partial}))
+    
+    def save_fingerprint(self, sha256, partial, size, video_id):
+        """Point a content hash at the video that holds its chunks"""
+        return self.fingerprints.update_one(
+            {'sha256': sha256},
+            {
+                '$set': {
+                    'partial': partial,
+                    'size': size,
+                    'video_id': video_id,
+                    'updated_at': datetime.utcnow()
+                },
+                '$setOnInsert': {'created_at': datetime.utcnow()}
+            },
+            upsert=True
+        )
+    
+    # Processing job queue (used by split workers)
+    def enqueue_job(self, video_id, filename, **kwargs):
+        """
+        Queue a video for processing by a split worker
+        
+        Args:
+            video_id (str): Video ID
+            filename (str): Stored video file name, relative to VIDEOS_DIR
+        """
+        now = datetime.utcnow()
+        job = {
+            'video_id': video_id,
+            'filename': filename,
+            'status': 'queued',  # queued, running, done, failed
+            'attempts': 0,
+            'worker_id': None,
+            'lease_expires_at': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        job.update(kwargs)
+        return self.jobs.insert_one(job)
+    
+    def claim_job(self, worker_id, lease_seconds, max_attempts):
+        """
+        Atomically claim the oldest runnable job
+        
+        Runnable jobs are queued ones and running ones whose lease has
+        expired (their worker died or stalled), as long as they have
+        attempts left.
+        
+        Returns:
+            dict: The claimed job, or None if there is nothing to do
+        """
+        from pymongo import ReturnDocument
+        now = datetime.utcnow()
+        return self.jobs.find_one_and_update(
+            {
+                '$or': [
+                    {'status': 'queued'},
+                    {'status': 'running', 'lease_expires_at': {'$lt': now}}
+                ],
+                'attempts': {'$lt': max_attempts}
+            },
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker_id': worker_id,
+                    'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                    'heartbeat_at': now,
+                    'updated_at': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def heartbeat_job(self, job_id, worker_id, lease_seconds):
+        """
+        Extend the lease of a job held by this worker
+        
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        now = datetime.utcnow()
+        result = self.jobs.update_one(
+            {'_id': job_id, 'worker_id': worker_id, 'status': 'running'},
+            {'$set': {
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'heartbeat_at': now
+            }}
+        )
+        return result.matched_count == 1
+    
+    def complete_job(self, job_id, worker_id):
+        """Mark a job held by this worker as done"""
+        result = self.jobs.update_one(
+            {'_id': job_id, 'worker_id': worker_id, 'status': 'running'},
+            {'$set': {'status': 'done', 'lease_expires_at': None, 'updated_at': datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+    
+    def fail_job(self, job_id, worker_id, error, retry):
+        """Release a job held by this worker, back to the queue or as failed"""
+        result = self.jobs.update_one(
+            {'_id': job_id, 'worker_id': worker_id, 'status': 'running'},
+            {'$set': {
+                'status': 'queued' if retry else 'failed',
+                'error': str(error),
+                'lease_expires_at': None,
+                'updated_at': datetime.utcnow()
+            }}
+        )
+        return result.matched_count == 1
+    
+    def get_active_job(self, video_id):
+        """Get the queued or running job for a video, if any"""
+        return self.jobs.find_one({'video_id': video_id, 'status': {'$in': ['queued', 'running']}})
+    
+    def expire_abandoned_jobs(self, max_attempts):
+        """
+        Fail jobs whose lease expired with no attempts left
+        
+        Returns:
+            list: video_ids of the jobs that were failed
+        """
+        now = datetime.utcnow()
+        query = {
+            'status': 'running',
+            'lease_expires_at': {'$lt': now},
+            'attempts': {'$gte': max_attempts}
+        }
+        video_ids = [job['video_id'] for job in self.jobs.find(query, {'video_id': 1})]
+        if video_ids:
+            self.jobs.update_many(query, {'$set': {
+                'status': 'failed',
+                'error': 'Lease expired too many times',
+                'lease_expires_at': None,
+                'updated_at': now
+            }})
+        return video_ids
+    
     # User authentication methods
     def create_user(self, user_data):
         """Create a new user"""
@@ -101,7 +387,9 @@ class MongoDB:
     
     def close(self):
         """Close database connection"""
-        self.client.close()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
 # Global database instance
 db = MongoDB()
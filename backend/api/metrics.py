@@ -0,0 +1,234 @@
+"""
+Lightweight in-process metrics for StreamSwarm API
+
+Counters, gauges and histograms are kept in memory and rendered in the
+Prometheus text exposition format on /metrics. Updates take a single lock
+and do no I/O, so they are cheap enough for the chunk-serving hot path.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets (seconds) suited to both fast requests and long ffmpeg runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    """Base class for a metric family with optional labels"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        bucket_labels = self.labelnames + ('le',)
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_labels, key + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render all metrics in Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Processing pipeline
+STAGE_SECONDS = registry.register(Histogram(
+    'streamswarm_stage_seconds',
+    'Time spent in each video processing stage',
+    ('stage',)
+))
+STAGE_BYTES = registry.register(Counter(
+    'streamswarm_stage_bytes_total',
+    'Bytes handled by each video processing stage',
+    ('stage',)
+))
+PROCESSING_QUEUE_DEPTH = registry.register(Gauge(
+    'streamswarm_processing_queue_depth',
+    'Videos uploaded but not yet finished processing in this process'
+))
+VIDEOS_PROCESSED = registry.register(Counter(
+    'streamswarm_videos_processed_total',
+    'Videos that finished processing, by outcome',
+    ('status',)
+))
+
+DUPLICATE_UPLOADS = registry.register(Counter(
+    'streamswarm_duplicate_uploads_total',
+    'Uploads matched to an existing video by content fingerprint'
+))
+
+# HTTP serving
+REQUEST_SECONDS = registry.register(Histogram(
+    'streamswarm_request_seconds',
+    'HTTP request latency by endpoint',
+    ('endpoint', 'method', 'status')
+))
+CHUNK_BYTES_SERVED = registry.register(Counter(
+    'streamswarm_chunk_bytes_served_total',
+    'Bytes of video chunks served over HTTP'
+))
+CHUNKS_SERVED = registry.register(Counter(
+    'streamswarm_chunks_served_total',
+    'Video chunks served over HTTP'
+))
+CHUNKS_THROTTLED = registry.register(Counter(
+    'streamswarm_chunks_throttled_total',
+    'Chunk requests refused by bandwidth shaping, by priority',
+    ('priority',)
+))
+
+
+class StageTimer:
+    """
+    Times the stages of one processing job
+
+    Each stage is observed in STAGE_SECONDS (and STAGE_BYTES when a byte
+    count is given) and also kept in `timings` so it can be stored on the
+    video document.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name, nbytes=None):
+        """
+        Time the enclosed block as stage `name`
+
+        Args:
+            name (str): Stage label
+            nbytes (int | callable): Bytes processed by the stage, or a
+                callable evaluated after the stage succeeds
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            self.timings[name] = round(elapsed, 4)
+        if nbytes is not None:
+            size = nbytes() if callable(nbytes) else nbytes
+            STAGE_BYTES.inc(size, stage=name)
+            if elapsed > 0:
+                self.timings[f'{name}_bytes_per_sec'] = round(size / elapsed, 1)
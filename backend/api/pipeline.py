@@ -0,0 +1,302 @@
+"""
+Video processing pipeline
+
+Shared by the API (inline background threads) and by standalone split
+workers (worker.py), so both produce identical chunks, manifests and
+database records.
+"""
+import os
+import sys
+import threading
+import time
+
+from .database import db
+from .metrics import StageTimer, PROCESSING_QUEUE_DEPTH, VIDEOS_PROCESSED
+from .utils import PARTIAL_UPLOAD_SUFFIX, generate_manifest, generate_virtual_manifest
+
+VIDEOS_DIR = os.getenv('VIDEOS_DIR', 'storage/videos')
+CHUNKS_DIR = os.getenv('CHUNKS_DIR', 'storage/chunks')
+
+# 'inline': process uploads in a background thread of this API process (default)
+# 'queue': enqueue a job for standalone split workers (worker.py)
+PROCESSING_MODE = os.getenv('PROCESSING_MODE', 'inline')
+
+# Inline mode: processing threads mark the video alive this often, so the
+# storage reaper can tell a slow split from an abandoned one, and each API
+# process checks this often for videos the reaper requeued
+PROCESSING_HEARTBEAT_SECONDS = float(os.getenv('PROCESSING_HEARTBEAT_SECONDS', 60))
+REQUEUE_POLL_SECONDS = float(os.getenv('REQUEUE_POLL_SECONDS', 60))
+
+# 'segments': ffmpeg writes one file per chunk (default)
+# 'index': one fragmented MP4 + fragment index; chunks are served as byte
+#          ranges and can be re-planned to any duration without re-splitting
+CHUNK_STORAGE_MODE = os.getenv('CHUNK_STORAGE_MODE', 'segments')
+
+# 'fixed': cut every 5 seconds (default)
+# 'adaptive': pick keyframe boundaries that keep chunks near CHUNK_TARGET_BYTES
+CHUNK_SEGMENTATION = os.getenv('CHUNK_SEGMENTATION', 'fixed')
+CHUNK_TARGET_BYTES = int(os.getenv('CHUNK_TARGET_BYTES', 2 * 1024 * 1024))
+CHUNK_MIN_DURATION = float(os.getenv('CHUNK_MIN_DURATION', 2))
+CHUNK_MAX_DURATION = float(os.getenv('CHUNK_MAX_DURATION', 10))
+
+# Seek-preview sprite sheets, written by the same ffmpeg run that splits
+# (segments mode only). 0 disables; otherwise seconds between thumbnails.
+THUMBNAIL_INTERVAL = float(os.getenv('THUMBNAIL_INTERVAL', 0))
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 160))
+THUMBNAIL_COLUMNS = int(os.getenv('THUMBNAIL_COLUMNS', 5))
+THUMBNAIL_ROWS = int(os.getenv('THUMBNAIL_ROWS', 5))
+
+
+class ProcessingCancelled(Exception):
+    """Raised by process_video when its cancel check says to stop"""
+
+
+def _import_splitting():
+    """Import the splitting modules on first use (they live beside api/)"""
+    backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+    from splitting import split, fragment_index, planner
+    return split, fragment_index, planner
+
+
+def _share_upload_with_media(video_id, video_path):
+    """
+    Replace an index-mode upload with a hard link to its remuxed stream.mp4
+
+    The fMP4 serves every chunk and re-indexes just as well as the original
+    (it is already fragmented, so index_video links it instead of
+    remuxing), so keeping both would store each video twice. Linking needs
+    VIDEOS_DIR and CHUNKS_DIR on the same filesystem; otherwise both copies
+    are kept.
+
+    Returns:
+        str: Upload filename (relative to VIDEOS_DIR) now backing the video
+    """
+    media_path = os.path.join(CHUNKS_DIR, video_id, 'stream.mp4')
+    linked_path = os.path.join(VIDEOS_DIR, f"{video_id}.mp4")
+    if os.path.exists(linked_path) and os.path.samefile(media_path, linked_path):
+        return os.path.basename(linked_path)
+
+    # Link under a temp name (cleaned up by the reaper if we crash) and
+    # rename over the upload, so the video always has a source on disk
+    tmp_path = linked_path + PARTIAL_UPLOAD_SUFFIX
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.link(media_path, tmp_path)
+        os.replace(tmp_path, linked_path)
+    except OSError as e:
+        print(f"⚠️  Keeping separate upload for {video_id}, can't hard-link stream.mp4: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return os.path.basename(video_path)
+
+    if os.path.abspath(video_path) != os.path.abspath(linked_path):
+        # Record the new name before dropping the old file, so a failed or
+        # cancelled attempt is retried from a file that exists and the
+        # reaper never takes the link for an orphan
+        db.rename_video_upload(video_id, os.path.basename(linked_path))
+        os.remove(video_path)
+    return os.path.basename(linked_path)
+
+
+def process_video(video_id, video_path, timer=None, cancelled=None):
+    """
+    Split a stored upload, build its manifest and mark the video ready
+
+    Raises on failure; callers decide whether to retry or call mark_failed.
+
+    Args:
+        cancelled (callable): Checked before each stage that writes shared
+            state; when it returns True, ProcessingCancelled is raised and
+            nothing more is written (e.g. a worker that lost its job lease)
+
+    Returns:
+        dict: Manifest data
+    """
+    split, fragment_index, planner = _import_splitting()
+    timer = timer or StageTimer()
+
+    def check_cancelled(stage):
+        if cancelled is not None and cancelled():
+            raise ProcessingCancelled(f"Processing of {video_id} cancelled before {stage}")
+
+    print(f"🎬 Starting processing for {video_id}")
+
+    # Update status to processing
+    with timer.stage('update_status'):
+        db.update_video_status(video_id, 'processing')
+
+    # Call the splitting function
+    # split.split_video expects: input_video, base_output_dir, chunk_duration
+    # Note: split_video creates a subdirectory named after the video (without extension)
+    # Since we save videos as {video_id}.mp4, the directory will be named {video_id}
+    storage_mode = CHUNK_STORAGE_MODE
+    segment_plan = None
+    if storage_mode != 'index' and CHUNK_SEGMENTATION == 'adaptive':
+        with timer.stage('plan'):
+            segment_plan = planner.plan_adaptive_segments(
+                video_path,
+                target_bytes=CHUNK_TARGET_BYTES,
+                min_duration=CHUNK_MIN_DURATION,
+                max_duration=CHUNK_MAX_DURATION
+            )
+
+    check_cancelled('split')
+    with timer.stage('split', nbytes=lambda: os.path.getsize(video_path)):
+        if storage_mode == 'index':
+            fragment_index.index_video(
+                input_video=video_path,
+                base_output_dir=CHUNKS_DIR
+            )
+        else:
+            split.split_video(
+                input_video=video_path,
+                base_output_dir=CHUNKS_DIR,
+                chunk_duration=5,
+                segment_times=segment_plan['segment_times'] if segment_plan else None,
+                thumbnail_interval=THUMBNAIL_INTERVAL or None,
+                thumbnail_width=THUMBNAIL_WIDTH,
+                sprite_columns=THUMBNAIL_COLUMNS,
+                sprite_rows=THUMBNAIL_ROWS
+            )
+
+    print(f"✅ Splitting complete for {video_id}")
+
+    check_cancelled('manifest')
+    extra = {}
+    if storage_mode == 'index':
+        extra['filename'] = _share_upload_with_media(video_id, video_path)
+
+    # Generate manifest
+    with timer.stage('manifest', nbytes=lambda: sum(c['size'] for c in manifest['chunks'])):
+        if storage_mode == 'index':
+            manifest = generate_virtual_manifest(video_id, CHUNKS_DIR, chunk_duration=5)
+        else:
+            manifest = generate_manifest(video_id, CHUNKS_DIR, segment_plan=segment_plan)
+
+    # Save chunk info to database (replacing any left by an earlier attempt)
+    chunks_data = manifest['chunks']
+    check_cancelled('save_chunks')
+    with timer.stage('save_chunks'):
+        db.delete_chunks(video_id)
+        db.save_chunks(video_id, chunks_data)
+
+    # Update video status
+    check_cancelled('ready')
+    db.update_video_status(
+        video_id,
+        'ready',
+        total_chunks=manifest['total_chunks'],
+        manifest_url=f'/api/manifest/{video_id}',
+        storage_mode=storage_mode,
+        stage_timings=timer.timings,
+        **extra
+    )
+    # Duplicate uploads of the same content share these chunks
+    db.update_linked_videos(
+        video_id,
+        'ready',
+        total_chunks=manifest['total_chunks'],
+        manifest_url=f'/api/manifest/{video_id}',
+        storage_mode=storage_mode,
+        **extra
+    )
+    VIDEOS_PROCESSED.inc(status='ready')
+
+    print(f"✅ Processing complete for {video_id} ({timer.timings})")
+    return manifest
+
+
+def mark_failed(video_id, error, timer=None):
+    """Record a terminal processing failure on the video"""
+    VIDEOS_PROCESSED.inc(status='failed')
+    db.update_video_status(
+        video_id,
+        'failed',
+        error=str(error),
+        stage_timings=timer.timings if timer else {}
+    )
+    db.update_linked_videos(video_id, 'failed', error=str(error))
+
+
+def process_video_async(video_id, video_path, timer=None):
+    """Background task to process video"""
+    timer = timer or StageTimer()
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(PROCESSING_HEARTBEAT_SECONDS):
+            try:
+                db.touch_video(video_id)
+            except Exception as e:
+                print(f"⚠️  Heartbeat failed for {video_id}: {e}")
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        process_video(video_id, video_path, timer)
+    except Exception as e:
+        print(f"❌ Processing failed for {video_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        mark_failed(video_id, e, timer)
+    finally:
+        stopped.set()
+        PROCESSING_QUEUE_DEPTH.dec()
+
+
+def dispatch_video(video_id, filename, timer=None):
+    """
+    Start processing a stored upload according to PROCESSING_MODE
+
+    Returns:
+        str: Status to report to the client ('queued' or 'processing')
+    """
+    timer = timer or StageTimer()
+    if PROCESSING_MODE == 'queue':
+        # Hand off to split workers through the jobs collection
+        with timer.stage('enqueue'):
+            db.enqueue_job(video_id, filename, stage_timings=timer.timings)
+        return 'queued'
+
+    # Start processing in background thread
+    PROCESSING_QUEUE_DEPTH.inc()
+    thread = threading.Thread(
+        target=process_video_async,
+        args=(video_id, os.path.join(VIDEOS_DIR, filename), timer)
+    )
+    thread.daemon = True
+    thread.start()
+    return 'processing'
+
+
+_requeue_poller = None
+
+
+def _poll_requeued_videos():
+    while True:
+        time.sleep(REQUEUE_POLL_SECONDS)
+        try:
+            while True:
+                video = db.claim_requeued_video()
+                if video is None:
+                    break
+                PROCESSING_QUEUE_DEPTH.inc()
+                process_video_async(video['video_id'], os.path.join(VIDEOS_DIR, video['filename']))
+        except Exception as e:
+            print(f"⚠️  Polling for requeued videos failed: {e}")
+
+
+def start_requeue_poller():
+    """
+    Inline mode: process videos requeued by the storage reaper
+
+    One daemon thread per process claims them one at a time, so recovery
+    never runs more than one extra split per API process. Its first poll is
+    after REQUEUE_POLL_SECONDS; startup does no database I/O.
+    """
+    global _requeue_poller
+    if _requeue_poller is None:
+        _requeue_poller = threading.Thread(target=_poll_requeued_videos, daemon=True, name='requeue-poller')
+        _requeue_poller.start()
@@ -0,0 +1,75 @@
+"""
+Opt-in per-request profiling for StreamSwarm API
+
+When PROFILING_ENABLED=True, a request carrying the `X-Profile` header is
+run under cProfile and the stats are written to PROFILE_DIR as a .prof
+file (load with `python -m pstats` or snakeviz). The file name is returned
+in the `X-Profile-File` response header. If PROFILING_TOKEN is set, the
+header value must match it.
+"""
+import cProfile
+import os
+import threading
+import time
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+
+# cProfile can only have one active profiler per process on recent Pythons,
+# so concurrent profiled requests are serialised by skipping the extras.
+_profiler_lock = threading.Lock()
+
+
+def init_profiling(app):
+    """Register profiling hooks on the app if enabled"""
+    if os.getenv('PROFILING_ENABLED', 'False') != 'True':
+        return
+
+    profile_dir = os.getenv('PROFILE_DIR', 'storage/profiles')
+    token = os.getenv('PROFILING_TOKEN')
+    os.makedirs(profile_dir, exist_ok=True)
+
+    @app.before_request
+    def start_profiler():
+        value = request.headers.get(PROFILE_HEADER)
+        if not value or (token and value != token):
+            return
+        if not _profiler_lock.acquire(blocking=False):
+            g.profile_skipped = True
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            _profiler_lock.release()
+            g.profile_skipped = True
+            return
+        g.profiler = profiler
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            if g.pop('profile_skipped', False):
+                response.headers['X-Profile-Skipped'] = 'busy'
+            return response
+        try:
+            profiler.disable()
+        finally:
+            _profiler_lock.release()
+
+        endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+        filename = f"{endpoint}-{int(time.time() * 1000)}.prof"
+        profiler.dump_stats(os.path.join(profile_dir, filename))
+        response.headers['X-Profile-File'] = filename
+        return response
+
+    @app.teardown_request
+    def release_profiler(exc):
+        # after_request is skipped on some error paths; never leak the lock
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+
+    print(f"🔬 Request profiling enabled (header: {PROFILE_HEADER}, dir: {profile_dir})")
@@ -0,0 +1,244 @@
+"""
+Storage reaper
+
+Reconciles storage/videos and storage/chunks with the videos collection
+and cleans up what crashes and failures leave behind:
+
+- staging directories (hidden *.partial) from interrupted splits
+- temp files (*.tmp manifests, *.part uploads) from interrupted writes
+- chunk directories and uploads that no video document refers to
+- duplicate uploads (linked via source_video_id) whose source video was
+  deleted: document only
+- failed videos: requeued while their source upload exists and they have
+  requeues left (REAPER_MAX_REQUEUES), otherwise deleted with their files
+- videos stuck in 'uploaded'/'processing' with no active job and no
+  processing heartbeat for longer than REAPER_STALE_SECONDS, and 'ready'
+  videos whose chunks are gone: requeued
+
+The reaper never splits videos itself. In queue mode a requeue enqueues a
+job for the split workers; in inline mode it marks the video `requeued`
+and an API process picks it up (pipeline.start_requeue_poller).
+
+Nothing younger than REAPER_GRACE_SECONDS is touched, so in-flight
+uploads and splits are safe. Filesystem and database operations are
+paced at REAPER_OPS_PER_SECOND so a large cleanup doesn't starve chunk
+serving of disk I/O.
+
+Run with `python manage.py reap` (once) or `python manage.py reap --loop`.
+"""
+import os
+import time
+from datetime import datetime
+
+from .database import db
+from .pipeline import VIDEOS_DIR, CHUNKS_DIR, PROCESSING_MODE, _import_splitting
+from .utils import PARTIAL_UPLOAD_SUFFIX
+
+INTERVAL_SECONDS = float(os.getenv('REAPER_INTERVAL_SECONDS', 600))
+GRACE_SECONDS = float(os.getenv('REAPER_GRACE_SECONDS', 3600))
+STALE_SECONDS = float(os.getenv('REAPER_STALE_SECONDS', 6 * 3600))
+MAX_REQUEUES = int(os.getenv('REAPER_MAX_REQUEUES', 2))
+OPS_PER_SECOND = float(os.getenv('REAPER_OPS_PER_SECOND', 200))
+
+
+class Reaper:
+    """One reconciliation pass over storage and the videos collection"""
+
+    def __init__(self, database=db, videos_dir=VIDEOS_DIR, chunks_dir=CHUNKS_DIR,
+                 grace_seconds=GRACE_SECONDS, stale_seconds=STALE_SECONDS,
+                 max_requeues=MAX_REQUEUES, ops_per_second=OPS_PER_SECOND,
+                 dry_run=False):
+        self.db = database
+        self.videos_dir = videos_dir
+        self.chunks_dir = chunks_dir
+        self.grace_seconds = grace_seconds
+        self.stale_seconds = stale_seconds
+        self.max_requeues = max_requeues
+        self.ops_per_second = ops_per_second
+        self.dry_run = dry_run
+        self._next_op = 0.0
+        self._videos = {}
+
+    # Pacing
+    def _throttle(self):
+        """Block until the next operation fits in the ops/second budget"""
+        if self.ops_per_second <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_op:
+            time.sleep(self._next_op - now)
+        self._next_op = max(now, self._next_op) + 1 / self.ops_per_second
+
+    def _age(self, path):
+        try:
+            return time.time() - os.lstat(path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def _remove(self, path):
+        """Delete a file or directory tree, one paced unlink at a time"""
+        if self.dry_run:
+            print(f"🧹 Would remove {path}")
+            return
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    self._throttle()
+                    os.remove(os.path.join(root, name))
+                self._throttle()
+                os.rmdir(root)
+        elif os.path.lexists(path):
+            self._throttle()
+            os.remove(path)
+
+    # Reconciliation
+    def run_once(self):
+        """
+        Run one reconciliation pass
+
+        Returns:
+            dict: Counts of what was removed, requeued and deleted
+        """
+        split, _, _ = _import_splitting()
+        stats = {
+            'staging_removed': 0,
+            'temp_files_removed': 0,
+            'orphan_chunk_dirs_removed': 0,
+            'orphan_uploads_removed': 0,
+            'videos_requeued': 0,
+            'videos_deleted': 0
+        }
+        # Read the collection before listing storage: a video created in
+        # between then has files younger than the grace period
+        videos = {video['video_id']: video for video in self.db.get_video_states()}
+        self._videos = videos
+        known_uploads = {video.get('filename') for video in videos.values()}
+
+        if os.path.isdir(self.chunks_dir):
+            for entry in os.scandir(self.chunks_dir):
+                self._throttle()
+                if self._age(entry.path) < self.grace_seconds:
+                    continue
+                if entry.name.startswith('.') and split.STAGING_SUFFIX in entry.name:
+                    self._remove(entry.path)
+                    stats['staging_removed'] += 1
+                elif entry.is_dir() and entry.name not in videos:
+                    self._remove(entry.path)
+                    stats['orphan_chunk_dirs_removed'] += 1
+                elif entry.is_dir():
+                    stats['temp_files_removed'] += self._remove_temp_files(entry.path)
+
+        if os.path.isdir(self.videos_dir):
+            for entry in os.scandir(self.videos_dir):
+                self._throttle()
+                if not entry.is_file() or entry.name.startswith('.') or self._age(entry.path) < self.grace_seconds:
+                    continue
+                if entry.name.endswith(PARTIAL_UPLOAD_SUFFIX):
+                    self._remove(entry.path)
+                    stats['temp_files_removed'] += 1
+                elif entry.name not in known_uploads:
+                    self._remove(entry.path)
+                    stats['orphan_uploads_removed'] += 1
+
+        for video in videos.values():
+            action = self._reconcile_video(video)
+            if action:
+                stats[action] += 1
+
+        return stats
+
+    def _remove_temp_files(self, directory):
+        removed = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.tmp') and self._age(entry.path) >= self.grace_seconds:
+                self._remove(entry.path)
+                removed += 1
+        return removed
+
+    def _reconcile_video(self, video):
+        """Requeue or delete one video if it needs it; returns the stats key"""
+        status = video.get('status')
+        updated_at = video.get('updated_at') or datetime.min
+        now = datetime.utcnow()
+        idle = (now - updated_at).total_seconds()
+
+        if video.get('source_video_id'):
+            # Duplicate upload sharing another video's files: it follows the
+            # source's status, and only its own document is deleted, once
+            # the source itself is gone
+            if video['source_video_id'] not in self._videos and idle >= self.grace_seconds:
+                return self._delete(video, None, delete_files=False)
+            return None
+        # In index mode the upload is a hard link to chunks/<id>/stream.mp4
+        # (see pipeline._share_upload_with_media); filename tracks it either way
+        source_path = os.path.join(self.videos_dir, video['filename']) if video.get('filename') else None
+        has_source = bool(source_path) and os.path.exists(source_path)
+
+        if status == 'failed' and idle >= self.grace_seconds:
+            if has_source and video.get('requeues', 0) < self.max_requeues:
+                return self._requeue(video, 'failed')
+            return self._delete(video, source_path)
+
+        if video.get('requeued'):
+            # Waiting for an API process to pick it up; not stuck
+            return None
+
+        # Inline processing threads refresh heartbeat_at while they run
+        heartbeat_at = max(updated_at, video.get('heartbeat_at') or datetime.min)
+        if status in ('uploaded', 'processing') and (now - heartbeat_at).total_seconds() >= self.stale_seconds:
+            self._throttle()
+            if self.db.get_active_job(video['video_id']) is None:
+                if has_source and video.get('requeues', 0) < self.max_requeues:
+                    return self._requeue(video, f'stuck in {status}')
+                return self._delete(video, source_path)
+
+        if status == 'ready' and idle >= self.grace_seconds and has_source:
+            self._throttle()
+            chunks_missing = not os.path.isdir(os.path.join(self.chunks_dir, video['video_id']))
+            if chunks_missing and video.get('requeues', 0) < self.max_requeues:
+                return self._requeue(video, 'chunks missing')
+
+        return None
+
+    def _requeue(self, video, reason):
+        video_id = video['video_id']
+        print(f"🔁 Requeueing {video_id} ({reason})")
+        if self.dry_run:
+            return 'videos_requeued'
+        self._throttle()
+        self.db.update_video_status(
+            video_id,
+            'uploaded',
+            requeues=video.get('requeues', 0) + 1,
+            requeued=PROCESSING_MODE != 'queue',
+            error=None
+        )
+        self.db.update_linked_videos(video_id, 'uploaded', error=None)
+        if PROCESSING_MODE == 'queue':
+            self._throttle()
+            self.db.enqueue_job(video_id, video['filename'])
+        return 'videos_requeued'
+
+    def _delete(self, video, source_path, delete_files=True):
+        video_id = video['video_id']
+        print(f"🗑️  Deleting {video['status']} video {video_id}")
+        if delete_files:
+            if source_path:
+                self._remove(source_path)
+            self._remove(os.path.join(self.chunks_dir, video_id))
+        if not self.dry_run:
+            self._throttle()
+            self.db.delete_video(video_id)
+        return 'videos_deleted'
+
+
+def run_forever(reaper, interval=INTERVAL_SECONDS):
+    """Run reconciliation passes every `interval` seconds until interrupted"""
+    while True:
+        started = time.monotonic()
+        try:
+            stats = reaper.run_once()
+            print(f"🧹 Reaper pass done in {time.monotonic() - started:.1f}s: {stats}")
+        except Exception as e:
+            print(f"⚠️  Reaper pass failed: {e}")
+        time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -1,90 +1,148 @@
+import io
+import math
 import os
-import sys
-from flask import Blueprint, request, jsonify, send_file
-from werkzeug.utils import secure_filename
+import re
 import threading
-import bcrypt
+from flask import Blueprint, Response, request, jsonify, send_file
+from werkzeug.wsgi import wrap_file
+from werkzeug.utils import secure_filename
 from functools import wraps
 
-# Add parent directory to path to import splitting modules
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from splitting import split
-
 from .database import db
+from .catalog import catalog, serialize_video
+from .auth import (
+    SESSION_TTL,
+    AuthBusyError,
+    TTLCache,
+    create_session_token,
+    hash_password,
+    user_cache,
+    verify_password,
+    verify_session_token
+)
+from .metrics import (
+    StageTimer,
+    DUPLICATE_UPLOADS,
+    CHUNKS_SERVED,
+    CHUNKS_THROTTLED,
+    CHUNK_BYTES_SERVED
+)
+from .pipeline import (
+    VIDEOS_DIR,
+    CHUNKS_DIR,
+    dispatch_video
+)
+from .shaping import client_key, is_urgent, shaper
 from .utils import (
+    FileRange,
+    calculate_partial_fingerprint,
+    calculate_stream_hash,
+    chunk_start_time,
     generate_video_id, 
-    generate_manifest,
-    ensure_directories
+    generate_virtual_manifest,
+    load_fragment_index,
+    save_stream_with_hash,
+    virtual_manifest_filename
 )
 
 api = Blueprint('api', __name__)
 
-VIDEOS_DIR = os.getenv('VIDEOS_DIR', 'storage/videos')
-CHUNKS_DIR = os.getenv('CHUNKS_DIR', 'storage/chunks')
+# Chunk durations index-mode manifests may be requested with. Each new one
+# hashes the whole media file once, so keep the list short.
+VIRTUAL_CHUNK_DURATIONS = sorted({
+    int(d) for d in os.getenv('VIRTUAL_CHUNK_DURATIONS', '2,4,5,6,10').split(',') if d.strip()
+})
+# Striped locks so concurrent misses for one manifest generate it once
+_virtual_manifest_locks = [threading.Lock() for _ in range(64)]
+MAX_CATALOG_PAGE_SIZE = int(os.getenv('MAX_CATALOG_PAGE_SIZE', 500))
+THUMBNAIL_CACHE_SECONDS = int(os.getenv('THUMBNAIL_CACHE_SECONDS', 86400))
+
+THUMBNAIL_FILE_RE = re.compile(r'^(thumbnails\.(vtt|json)|sprite_\d{3,}\.jpg)$')
+THUMBNAIL_MIMETYPES = {
+    '.vtt': 'text/vtt',
+    '.json': 'application/json',
+    '.jpg': 'image/jpeg'
+}
 
-# Ensure directories exist
-ensure_directories()
+# Duplicate upload video_id -> video whose chunk directory serves it
+_media_sources = TTLCache(60, 10000)
 
 # Authentication helper
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def get_current_user():
+    """
+    Get current user from the request
 
-def verify_password(password, password_hash):
-    """Verify a password against a hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    An `Authorization: Bearer <token>` session token is verified locally
+    without a database lookup. The legacy `X-User-ID` header is still
+    accepted and resolved through a short-lived user cache.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        claims = verify_session_token(auth_header[len('Bearer '):].strip())
+        if claims:
+            return {'_id': claims['sub'], 'username': claims['username'], 'email': claims['email']}
+        return None
 
-def get_current_user():
-    """Get current user from session (simple implementation)"""
-    # In a production app, you'd use JWT tokens or session management
-    # For now, we'll use a simple header-based approach
     user_id = request.headers.get('X-User-ID')
     if user_id:
-        return db.get_user_by_id(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = db.get_user_by_id(user_id)
+            if user:
+                user_cache.set(user_id, user)
+        return user
     return None
 
-def process_video_async(video_id, video_path, original_filename):
-    """Background task to process video"""
-    try:
-        print(f"🎬 Starting processing for {video_id}")
-        
-        # Update status to processing
-        db.update_video_status(video_id, 'processing')
-        
-        # Call the splitting function
-        # split.split_video expects: input_video, base_output_dir, chunk_duration
-        # Note: split_video creates a subdirectory named after the video (without extension)
-        # Since we save videos as {video_id}.mp4, the directory will be named {video_id}
-        split.split_video(
-            input_video=video_path,
-            base_output_dir=CHUNKS_DIR,
-            chunk_duration=5
-        )
-        
-        print(f"✅ Splitting complete for {video_id}")
-        
-        # Generate manifest
-        manifest = generate_manifest(video_id, CHUNKS_DIR)
-        
-        # Save chunk info to database
-        chunks_data = manifest['chunks']
-        db.save_chunks(video_id, chunks_data)
-        
-        # Update video status
-        db.update_video_status(
-            video_id, 
-            'ready',
-            total_chunks=manifest['total_chunks'],
-            manifest_url=f'/api/manifest/{video_id}'
-        )
-        
-        print(f"✅ Processing complete for {video_id}")
-        
-    except Exception as e:
-        print(f"❌ Processing failed for {video_id}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        db.update_video_status(video_id, 'failed', error=str(e))
+def auth_busy_response():
+    """503 returned when the password hashing pool is saturated"""
+    response = jsonify({'error': 'Authentication service busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def link_duplicate_upload(source, user_id, file, file_ext, sha256):
+    """
+    Record an upload whose content is already stored as `source`
+
+    A signed-in user who uploaded this content before gets their own video
+    back. Otherwise a new video is created for the uploader that reuses the
+    source's chunks and manifest (source_video_id) and follows its
+    processing status. Each uploader owns their video, and the API never
+    shows them the source's video_id, file name or content hash (see
+    media_video_id and catalog.PRIVATE_VIDEO_FIELDS).
+    """
+    if user_id is not None:
+        own = db.find_user_video_by_hash(sha256, user_id)
+        if own:
+            return jsonify({
+                'video_id': own['video_id'],
+                'message': 'Video already uploaded',
+                'status': own['status'],
+                'duplicate': True
+            }), 200
+
+    video_id = generate_video_id()
+    video = {
+        'video_id': video_id,
+        'filename': source['filename'],
+        'original_name': secure_filename(file.filename),
+        'status': source['status'],
+        'total_chunks': source.get('total_chunks', 0),
+        'user_id': user_id,
+        'sha256': sha256,
+        'source_video_id': source['video_id']
+    }
+    for key in ('manifest_url', 'storage_mode'):
+        if key in source:
+            video[key] = source[key]
+    db.save_video(video)
+    # Answered like any other upload, so it doesn't announce that someone
+    # else already has this file
+    return jsonify({
+        'video_id': video_id,
+        'message': 'Video uploaded and processing started',
+        'status': video['status']
+    }), 202
 
 
 # Authentication routes
@@ -123,7 +181,10 @@ def signup():
         return jsonify({'error': 'Username already taken'}), 400
     
     # Hash password
-    password_hash = hash_password(password)
+    try:
+        password_hash = hash_password(password)
+    except AuthBusyError:
+        return auth_busy_response()
     
     # Create user
     result = db.create_user({
@@ -150,7 +211,9 @@ def signin():
     Response: {
         "message": "Sign in successful",
         "user_id": "string",
-        "username": "string"
+        "username": "string",
+        "token": "string",
+        "expires_in": 604800
     }
     """
     data = request.get_json()
@@ -171,14 +234,21 @@ def signin():
         return jsonify({'error': 'Invalid email or password'}), 401
     
     # Verify password
-    if not verify_password(password, user['password_hash']):
-        return jsonify({'error': 'Invalid email or password'}), 401
-    
+    try:
+        if not verify_password(password, user['password_hash']):
+            return jsonify({'error': 'Invalid email or password'}), 401
+    except AuthBusyError:
+        return auth_busy_response()
+
+    token = create_session_token(user)
+
     return jsonify({
         'message': 'Sign in successful',
         'user_id': str(user['_id']),
         'username': user['username'],
-        'email': user['email']
+        'email': user['email'],
+        'token': token,
+        'expires_in': SESSION_TTL
     }), 200
 
 
@@ -191,8 +261,11 @@ def signout():
         "message": "Signed out successfully"
     }
     """
-    # In a stateless API, signout is mainly client-side
-    # You might want to invalidate tokens here if using JWT
+    # Session tokens are stateless, so signout is client-side: the client
+    # drops its token. Evict any cached legacy X-User-ID lookup.
+    user_id = request.headers.get('X-User-ID')
+    if user_id:
+        user_cache.invalidate(user_id)
     return jsonify({
         'message': 'Signed out successfully'
     }), 200
@@ -210,6 +283,11 @@ def upload_video():
         "message": "Video uploaded successfully",
         "status": "processing"
     }
+    
+    If the same file was uploaded before (and did not fail), nothing is
+    stored or processed: the uploader gets a video_id of their own that
+    shares the existing chunks (see link_duplicate_upload). Only their own
+    earlier upload is reported as "duplicate": true.
     """
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
@@ -229,36 +307,67 @@ def upload_video():
     user = get_current_user()
     user_id = str(user['_id']) if user else None
     
+    timer = StageTimer()
+    stream = file.stream
+    sha256 = None
+    partial = None
+    
+    # Duplicate check: the partial fingerprint rules out almost every new
+    # file without reading it; only on a partial match is the full hash
+    # computed before deciding. Werkzeug spools uploads to a
+    # SpooledTemporaryFile, which has no seekable() before Python 3.11,
+    # so just try to seek.
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        size = None
+    if size is not None:
+        with timer.stage('fingerprint'):
+            partial = calculate_partial_fingerprint(stream, size)
+            candidates = db.find_fingerprints(partial)
+            if candidates:
+                sha256 = calculate_stream_hash(stream)
+                stream.seek(0)
+                for fingerprint in candidates:
+                    if fingerprint['sha256'] != sha256:
+                        continue
+                    existing = db.get_video(fingerprint['video_id'])
+                    if existing and existing['status'] != 'failed':
+                        DUPLICATE_UPLOADS.inc()
+                        return link_duplicate_upload(existing, user_id, file, file_ext, sha256)
+    
     # Generate unique video ID
     video_id = generate_video_id()
     filename = secure_filename(file.filename)
     
-    # Save file
+    # Save file, hashing it on the way
     video_path = os.path.join(VIDEOS_DIR, f"{video_id}{file_ext}")
-    file.save(video_path)
-    
+    with timer.stage('upload_save', nbytes=lambda: size):
+        sha256, size = save_stream_with_hash(stream, video_path)
+    if partial is None:
+        with open(video_path, 'rb') as f:
+            partial = calculate_partial_fingerprint(f, size)
+
     # Save to database
-    db.save_video({
-        'video_id': video_id,
-        'filename': f"{video_id}{file_ext}",
-        'original_name': filename,
-        'status': 'uploaded',
-        'total_chunks': 0,
-        'user_id': user_id
-    })
-    
-    # Start processing in background thread
-    thread = threading.Thread(
-        target=process_video_async,
-        args=(video_id, video_path, filename)
-    )
-    thread.daemon = True
-    thread.start()
+    with timer.stage('save_video'):
+        db.save_video({
+            'video_id': video_id,
+            'filename': f"{video_id}{file_ext}",
+            'original_name': filename,
+            'status': 'uploaded',
+            'total_chunks': 0,
+            'user_id': user_id,
+            'sha256': sha256
+        })
+        db.save_fingerprint(sha256, partial, size, video_id)
+    
+    status = dispatch_video(video_id, f"{video_id}{file_ext}", timer)
     
     return jsonify({
         'video_id': video_id,
         'message': 'Video uploaded and processing started',
-        'status': 'processing'
+        'status': status
     }), 202
 
 
@@ -267,6 +376,12 @@ def get_videos():
     """
     Get all videos
     
+    Query (all optional):
+        status=ready        only videos with this status
+        user_id=...         only videos uploaded by this user
+        sort=newest|oldest  order by created_at (default newest)
+        page=1&per_page=50  paginate; adds page, per_page and total
+    
     Response: {
         "videos": [
             {
@@ -278,19 +393,31 @@ def get_videos():
             }
         ]
     }
-    """
-    videos = db.get_all_videos()
     
-    # Convert ObjectId to string for JSON serialization
-    for video in videos:
-        video['_id'] = str(video['_id'])
-        # Convert datetime to ISO format
-        if 'created_at' in video and video['created_at']:
-            video['created_at'] = video['created_at'].isoformat()
-        if 'updated_at' in video and video['updated_at']:
-            video['updated_at'] = video['updated_at'].isoformat()
+    Served from the in-memory catalog snapshot with an ETag; send
+    If-None-Match to get 304 when nothing changed.
+    """
+    sort = request.args.get('sort', 'newest')
+    if sort not in ('newest', 'oldest'):
+        return jsonify({'error': 'sort must be newest or oldest'}), 400
+    
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    if page is not None and (page < 1 or not 1 <= per_page <= MAX_CATALOG_PAGE_SIZE):
+        return jsonify({'error': f'page must be >= 1 and per_page between 1 and {MAX_CATALOG_PAGE_SIZE}'}), 400
+    
+    body, etag = catalog.get_page(
+        status=request.args.get('status'),
+        user_id=request.args.get('user_id'),
+        sort=sort,
+        page=page,
+        per_page=per_page
+    )
     
-    return jsonify({'videos': videos})
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 @api.route('/video/<video_id>', methods=['GET'])
@@ -310,14 +437,7 @@ def get_video(video_id):
     if not video:
         return jsonify({'error': 'Video not found'}), 404
     
-    video['_id'] = str(video['_id'])
-    # Convert datetime to ISO format
-    if 'created_at' in video and video['created_at']:
-        video['created_at'] = video['created_at'].isoformat()
-    if 'updated_at' in video and video['updated_at']:
-        video['updated_at'] = video['updated_at'].isoformat()
-    
-    return jsonify(video)
+    return jsonify(serialize_video(video))
 
 
 @api.route('/manifest/<video_id>', methods=['GET'])
@@ -339,6 +459,10 @@ def get_manifest(video_id):
             }
         ]
     }
+
+    Videos stored in 'index' mode accept ?chunk_duration=N (seconds) and
+    return range-addressable chunks of that duration, planned from the
+    fragment index without re-splitting.
     """
     video = db.get_video(video_id)
     
@@ -347,9 +471,26 @@ def get_manifest(video_id):
     
     if video['status'] != 'ready':
         return jsonify({'error': f"Video not ready. Status: {video['status']}"}), 400
-    
-    # Read manifest file
-    manifest_path = os.path.join(CHUNKS_DIR, video_id, 'manifest.json')
+
+    # Duplicate uploads are served from the video that holds the chunks,
+    # under their own video_id
+    source_id = video.get('source_video_id', video_id)
+
+    chunk_duration = request.args.get('chunk_duration', type=int)
+    if chunk_duration is not None and video.get('storage_mode') == 'index':
+        if chunk_duration not in VIRTUAL_CHUNK_DURATIONS:
+            return jsonify({'error': f'chunk_duration must be one of {VIRTUAL_CHUNK_DURATIONS}'}), 400
+        manifest_path = os.path.join(CHUNKS_DIR, source_id, virtual_manifest_filename(chunk_duration))
+        if not os.path.exists(manifest_path):
+            lock = _virtual_manifest_locks[hash((source_id, chunk_duration)) % len(_virtual_manifest_locks)]
+            with lock:
+                # Another request may have written it while we waited
+                if not os.path.exists(manifest_path):
+                    manifest = generate_virtual_manifest(source_id, CHUNKS_DIR, chunk_duration)
+                    return jsonify(relabel_manifest(manifest, video_id))
+    else:
+        # Read manifest file
+        manifest_path = os.path.join(CHUNKS_DIR, source_id, 'manifest.json')
     
     if not os.path.exists(manifest_path):
         return jsonify({'error': 'Manifest not found'}), 404
@@ -358,7 +499,43 @@ def get_manifest(video_id):
     with open(manifest_path, 'r') as f:
         manifest = json.load(f)
     
-    return jsonify(manifest)
+    return jsonify(relabel_manifest(manifest, video_id))
+
+
+def relabel_manifest(manifest, video_id):
+    """Present a source video's manifest under a duplicate upload's own video_id"""
+    source_id = manifest['video_id']
+    if source_id == video_id:
+        return manifest
+
+    def relabel(url):
+        return url.replace(f'/{source_id}/', f'/{video_id}/', 1)
+
+    manifest = dict(manifest, video_id=video_id)
+    manifest['chunks'] = [dict(chunk, url=relabel(chunk['url'])) for chunk in manifest['chunks']]
+    if 'init' in manifest:
+        manifest['init'] = dict(manifest['init'], url=relabel(manifest['init']['url']))
+    if 'thumbnails' in manifest:
+        manifest['thumbnails'] = {key: relabel(url) for key, url in manifest['thumbnails'].items()}
+    return manifest
+
+
+def media_video_id(video_id):
+    """
+    Video whose chunk directory serves requests for video_id
+
+    Duplicate uploads have no directory of their own and are served from
+    their source's; the database is only asked when the directory is
+    missing, and the answer is cached briefly.
+    """
+    if os.path.isdir(os.path.join(CHUNKS_DIR, video_id)):
+        return video_id
+    source_id = _media_sources.get(video_id)
+    if source_id is None:
+        video = db.get_video(video_id)
+        source_id = video.get('source_video_id', video_id) if video else video_id
+        _media_sources.set(video_id, source_id)
+    return source_id
 
 
 @api.route('/chunks/<video_id>/<chunk_filename>', methods=['GET'])
@@ -367,13 +544,24 @@ def serve_chunk(video_id, chunk_filename):
     Serve a specific video chunk
     
     URL: /api/chunks/{video_id}/chunk_000.mp4
-    Response: Binary MP4 file
+    Headers (optional): X-Playhead: <current playback position, seconds>
+    Response: Binary MP4 file, or 429 with Retry-After when bandwidth
+    shaping refuses it
     """
+    video_id = media_video_id(video_id)
     chunk_path = os.path.join(CHUNKS_DIR, video_id, chunk_filename)
     
     if not os.path.exists(chunk_path):
         return jsonify({'error': 'Chunk not found'}), 404
-    
+
+    size = os.path.getsize(chunk_path)
+    throttled = throttle_chunk(size, lambda: chunk_start_time(video_id, CHUNKS_DIR, chunk_filename))
+    if throttled:
+        return throttled
+
+    CHUNKS_SERVED.inc()
+    CHUNK_BYTES_SERVED.inc(size)
+
     return send_file(
         chunk_path,
         mimetype='video/mp4',
@@ -382,6 +570,127 @@ def serve_chunk(video_id, chunk_filename):
     )
 
 
+@api.route('/thumbnails/<video_id>/<filename>', methods=['GET'])
+def serve_thumbnails(video_id, filename):
+    """
+    Serve seek-preview files: thumbnails.vtt, thumbnails.json and the
+    sprite sheets they reference
+
+    URL: /api/thumbnails/{video_id}/thumbnails.vtt
+    Response: WebVTT track (cues point at sprite_NNN.jpg#xywh=x,y,w,h,
+    relative to this URL), cacheable with ETag revalidation
+    """
+    if not THUMBNAIL_FILE_RE.match(filename):
+        return jsonify({'error': 'Thumbnail file not found'}), 404
+
+    path = os.path.join(CHUNKS_DIR, media_video_id(video_id), filename)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Thumbnail file not found'}), 404
+
+    return send_file(
+        path,
+        mimetype=THUMBNAIL_MIMETYPES[os.path.splitext(filename)[1]],
+        as_attachment=False,
+        download_name=filename,
+        conditional=True,
+        max_age=THUMBNAIL_CACHE_SECONDS
+    )
+
+
+def throttle_chunk(nbytes, chunk_start=None, urgent=None):
+    """
+    Apply bandwidth shaping to a chunk transfer
+
+    Args:
+        nbytes (int): Size of the chunk
+        chunk_start (callable): Returns the chunk's start time in seconds
+            (or None), compared against the client's X-Playhead hint
+        urgent (bool): Skip the hint and use this priority
+
+    Returns:
+        tuple: 429 response with Retry-After, or None if admitted
+    """
+    if not shaper.enabled:
+        return None
+    if urgent is None:
+        urgent = is_urgent(request, chunk_start)
+    wait = shaper.admit(client_key(request), nbytes, urgent)
+    if not wait:
+        return None
+
+    retry_after = max(1, math.ceil(wait))
+    CHUNKS_THROTTLED.inc(priority='urgent' if urgent else 'prefetch')
+    response = jsonify({'error': 'Bandwidth limit reached, retry later', 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def _send_file_range(path, offset, length, download_name):
+    """Stream a byte range of a file, via sendfile where the server supports it"""
+    response = Response(
+        wrap_file(request.environ, FileRange(path, offset, length)),
+        mimetype='video/mp4',
+        direct_passthrough=True
+    )
+    response.content_length = length
+    response.headers['Content-Disposition'] = f'inline; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    CHUNKS_SERVED.inc()
+    CHUNK_BYTES_SERVED.inc(length)
+    return response
+
+
+@api.route('/vchunks/<video_id>/init', methods=['GET'])
+def serve_virtual_init(video_id):
+    """
+    Serve the init segment (ftyp + moov) of an index-mode video
+
+    URL: /api/vchunks/{video_id}/init
+    Response: Binary MP4 init segment
+    """
+    video_id = media_video_id(video_id)
+    index = load_fragment_index(video_id, CHUNKS_DIR)
+    if index is None:
+        return jsonify({'error': 'Video index not found'}), 404
+
+    # Nothing plays without the init segment, so it is always urgent
+    throttled = throttle_chunk(index['init']['size'], urgent=True)
+    if throttled:
+        return throttled
+
+    media_path = os.path.join(CHUNKS_DIR, video_id, index['media'])
+    return _send_file_range(media_path, 0, index['init']['size'], 'init.mp4')
+
+
+@api.route('/vchunks/<video_id>/<int:first>/<int:last>', methods=['GET'])
+def serve_virtual_chunk(video_id, first, last):
+    """
+    Serve fragments first..last (inclusive) of an index-mode video
+
+    URL: /api/vchunks/{video_id}/{first}/{last}
+    Headers (optional): X-Playhead: <current playback position, seconds>
+    Response: Binary fMP4 media segment (moof/mdat pairs), or 429 with
+    Retry-After when bandwidth shaping refuses it
+    """
+    video_id = media_video_id(video_id)
+    index = load_fragment_index(video_id, CHUNKS_DIR)
+    if index is None:
+        return jsonify({'error': 'Video index not found'}), 404
+
+    fragments = index['fragments']
+    if first > last or last >= len(fragments):
+        return jsonify({'error': 'Chunk not found'}), 404
+
+    offset = fragments[first]['offset']
+    length = fragments[last]['offset'] + fragments[last]['size'] - offset
+    throttled = throttle_chunk(length, lambda: fragments[first]['time'])
+    if throttled:
+        return throttled
+
+    media_path = os.path.join(CHUNKS_DIR, video_id, index['media'])
+    return _send_file_range(media_path, offset, length, f'fragments_{first}_{last}.m4s')
+
+
 @api.route('/status/<video_id>', methods=['GET'])
 def get_status(video_id):
     """
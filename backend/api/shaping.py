@@ -0,0 +1,155 @@
+"""
+Bandwidth shaping for chunk serving
+
+Token buckets cap egress per client (SHAPING_CLIENT_BYTES_PER_SEC) and for
+the whole process (SHAPING_GLOBAL_BYTES_PER_SEC). A chunk is admitted only
+when both buckets can pay for its size; otherwise the request is refused
+with 429 and a Retry-After telling the client when it would fit.
+
+Requests are prioritized by distance from the client's playhead, sent as
+`X-Playhead: <seconds>`. Chunks starting within SHAPING_URGENT_SECONDS of
+it are urgent: they may spend the SHAPING_URGENT_RESERVE share of the
+global bucket that prefetch can't touch, and may overdraw the client's own
+bucket by one burst, so a viewer whose prefetch used up its budget still
+gets the chunk it is about to play (the debt then slows its prefetch, and
+caps what a client faking the hint can gain). Requests without the hint
+count as prefetch. Under contention the budget therefore goes to viewers
+that are about to stall first.
+
+Buckets live in process memory, so limits apply per API process.
+"""
+import math
+import os
+import threading
+import time
+
+GLOBAL_BYTES_PER_SEC = float(os.getenv('SHAPING_GLOBAL_BYTES_PER_SEC', 0))
+CLIENT_BYTES_PER_SEC = float(os.getenv('SHAPING_CLIENT_BYTES_PER_SEC', 0))
+BURST_SECONDS = float(os.getenv('SHAPING_BURST_SECONDS', 2))
+URGENT_SECONDS = float(os.getenv('SHAPING_URGENT_SECONDS', 15))
+URGENT_RESERVE = float(os.getenv('SHAPING_URGENT_RESERVE', 0.25))
+TRUST_PROXY = os.getenv('SHAPING_TRUST_PROXY', 'false').lower() == 'true'
+
+PLAYHEAD_HEADER = 'X-Playhead'
+_PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """Byte budget refilled at `rate` per second, holding up to `burst`"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, nbytes, floor=0.0):
+        """
+        Seconds until nbytes can be taken without dropping below floor
+
+        A full bucket admits anything, so chunks larger than the burst are
+        still served (the bucket goes negative and pays it back).
+        """
+        if self.tokens - nbytes >= floor or self.tokens >= self.burst:
+            return 0.0
+        needed = min(nbytes + floor, self.burst) - self.tokens
+        return needed / self.rate
+
+    def take(self, nbytes):
+        self.tokens -= nbytes
+
+
+class Shaper:
+    """Per-client and global admission control for chunk transfers"""
+
+    def __init__(self, global_rate=GLOBAL_BYTES_PER_SEC, client_rate=CLIENT_BYTES_PER_SEC,
+                 burst_seconds=BURST_SECONDS, urgent_reserve=URGENT_RESERVE):
+        now = time.monotonic()
+        self.client_rate = client_rate
+        self.burst_seconds = burst_seconds
+        self.global_bucket = None
+        self.reserve = 0.0
+        if global_rate > 0:
+            self.global_bucket = TokenBucket(global_rate, global_rate * burst_seconds, now)
+            self.reserve = self.global_bucket.burst * urgent_reserve
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._last_prune = now
+
+    @property
+    def enabled(self):
+        return self.global_bucket is not None or self.client_rate > 0
+
+    def admit(self, client, nbytes, urgent=False):
+        """
+        Charge nbytes to the client and global budgets if they allow it
+
+        Returns:
+            float: 0 if admitted, else seconds until the request would fit
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune >= _PRUNE_INTERVAL:
+                self._prune(now)
+
+            wait = 0.0
+            if self.global_bucket is not None:
+                self.global_bucket.refill(now)
+                wait = self.global_bucket.wait_time(nbytes, 0.0 if urgent else self.reserve)
+
+            bucket = None
+            if self.client_rate > 0:
+                bucket = self._clients.get(client)
+                if bucket is None:
+                    bucket = TokenBucket(self.client_rate, self.client_rate * self.burst_seconds, now)
+                    self._clients[client] = bucket
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(nbytes, -bucket.burst if urgent else 0.0))
+
+            if wait > 0:
+                return wait
+            if self.global_bucket is not None:
+                self.global_bucket.take(nbytes)
+            if bucket is not None:
+                bucket.take(nbytes)
+            return 0.0
+
+    def _prune(self, now):
+        """Forget clients whose buckets have refilled (they're idle); caller holds the lock"""
+        for client, bucket in list(self._clients.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._clients[client]
+        self._last_prune = now
+
+
+def client_key(request):
+    """Identify the client a chunk request is charged to"""
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+
+def is_urgent(request, chunk_start):
+    """
+    True when the chunk starts close to the playhead the client reported
+
+    Args:
+        request: Flask request carrying the X-Playhead hint (seconds)
+        chunk_start (callable): Returns the media time the requested chunk
+            starts at, or None if unknown; only called when a hint is sent
+    """
+    playhead = request.headers.get(PLAYHEAD_HEADER, type=float)
+    if playhead is None or math.isnan(playhead):
+        return False
+    start = chunk_start()
+    return start is not None and abs(start - playhead) <= URGENT_SECONDS
+
+
+shaper = Shaper()
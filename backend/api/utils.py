@@ -2,6 +2,7 @@ import os
 import json
 import hashlib
 import uuid
+from functools import lru_cache
 from pathlib import Path
 
 def generate_video_id():
@@ -16,13 +17,94 @@ def calculate_file_hash(filepath):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
+FINGERPRINT_EDGE_BYTES = 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+# In-progress uploads are written under this suffix and renamed when complete
+PARTIAL_UPLOAD_SUFFIX = ".part"
+
+def calculate_partial_fingerprint(f, size):
+    """
+    Fast fingerprint of a seekable file: SHA-256 of its size, first MiB and last MiB
+
+    Different files almost always differ here, so a miss proves an upload
+    is new without reading it all; a hit is confirmed with the full hash.
+    """
+    partial_hash = hashlib.sha256(str(size).encode('utf-8'))
+    f.seek(0)
+    partial_hash.update(f.read(FINGERPRINT_EDGE_BYTES))
+    if size > FINGERPRINT_EDGE_BYTES:
+        f.seek(max(size - FINGERPRINT_EDGE_BYTES, FINGERPRINT_EDGE_BYTES))
+        partial_hash.update(f.read(FINGERPRINT_EDGE_BYTES))
+    f.seek(0)
+    return partial_hash.hexdigest()
+
+def calculate_stream_hash(stream):
+    """Calculate SHA-256 hash of a stream from its current position"""
+    sha256_hash = hashlib.sha256()
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b""):
+        sha256_hash.update(block)
+    return sha256_hash.hexdigest()
+
+def save_stream_with_hash(stream, filepath):
+    """
+    Copy a stream to disk, hashing it on the way
+
+    The data goes to filepath + PARTIAL_UPLOAD_SUFFIX and is renamed into
+    place only when complete, so an interrupted upload never leaves a
+    truncated file under the final name.
+
+    Returns:
+        tuple: (sha256 hex digest, bytes written)
+    """
+    sha256_hash = hashlib.sha256()
+    size = 0
+    partial_path = filepath + PARTIAL_UPLOAD_SUFFIX
+    try:
+        with open(partial_path, "wb") as f:
+            for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b""):
+                sha256_hash.update(block)
+                f.write(block)
+                size += len(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial_path, filepath)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return sha256_hash.hexdigest(), size
+
 def get_video_name(filename):
     """Extract video name without extension"""
     return os.path.splitext(filename)[0]
 
-def generate_manifest(video_id, chunks_dir):
+def write_json_atomic(path, data):
+    """
+    Write JSON via a temp file and rename, so readers (and a crash midway)
+    only ever see the old file or the complete new one
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def generate_manifest(video_id, chunks_dir, segment_plan=None):
     """
     Generate manifest.json for a processed video
+
+    Args:
+        video_id (str): Video ID
+        chunks_dir (str): Base chunks directory
+        segment_plan (dict): Optional adaptive plan from
+            planner.plan_adaptive_segments; its boundaries are recorded
+            as per-chunk start/duration
     
     Returns:
         dict: Manifest data
@@ -49,23 +131,42 @@ def generate_manifest(video_id, chunks_dir):
         'chunks': []
     }
     
+    starts = None
+    if segment_plan:
+        manifest['segmentation'] = 'adaptive'
+        manifest['target_bytes'] = segment_plan['target_bytes']
+        manifest['segment_times'] = segment_plan['segment_times']
+        # Only trust the plan if ffmpeg cut exactly where it was told to
+        if len(segment_plan['segment_times']) + 1 == len(chunk_files):
+            starts = [0.0] + segment_plan['segment_times'] + [segment_plan['duration']]
+            manifest['chunk_duration'] = round(segment_plan['duration'] / len(chunk_files), 3)
+    
     for idx, filename in enumerate(chunk_files):
         filepath = os.path.join(video_chunks_dir, filename)
         file_size = os.path.getsize(filepath)
         file_hash = calculate_file_hash(filepath)
         
-        manifest['chunks'].append({
+        chunk = {
             'id': idx,
             'filename': filename,
             'hash': file_hash,
             'size': file_size,
             'url': f'/api/chunks/{video_id}/{filename}'
-        })
+        }
+        if starts:
+            chunk['start'] = round(starts[idx], 6)
+            chunk['duration'] = round(max(starts[idx + 1] - starts[idx], 0), 6)
+        manifest['chunks'].append(chunk)
+    
+    # Seek previews written alongside the chunks (split_video thumbnail_interval)
+    if os.path.exists(os.path.join(video_chunks_dir, 'thumbnails.vtt')):
+        manifest['thumbnails'] = {
+            'vtt': f'/api/thumbnails/{video_id}/thumbnails.vtt',
+            'index': f'/api/thumbnails/{video_id}/thumbnails.json'
+        }
     
     # Save manifest to file
-    manifest_path = os.path.join(video_chunks_dir, 'manifest.json')
-    with open(manifest_path, 'w') as f:
-        json.dump(manifest, f, indent=2)
+    write_json_atomic(os.path.join(video_chunks_dir, 'manifest.json'), manifest)
     
     return manifest
 
@@ -79,3 +180,168 @@ def ensure_directories():
     for directory in dirs:
         Path(directory).mkdir(parents=True, exist_ok=True)
 
+
+class FileRange:
+    """
+    File-like view of bytes [offset, offset + length) of a file
+
+    The underlying descriptor is positioned at `offset`, so a WSGI server
+    whose file_wrapper uses sendfile (e.g. gunicorn) sends the range with
+    os.sendfile for Content-Length bytes; other servers fall back to
+    read(), which stops at the end of the range.
+    """
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+@lru_cache(maxsize=256)
+def _load_fragment_index(index_path, mtime):
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+def load_fragment_index(video_id, chunks_dir):
+    """
+    Load the fragment index written by split.index_video
+
+    Returns:
+        dict: Fragment index, or None if the video has no index
+    """
+    index_path = os.path.join(chunks_dir, video_id, 'index.json')
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        return None
+    return _load_fragment_index(index_path, mtime)
+
+@lru_cache(maxsize=256)
+def _load_chunk_starts(manifest_path, mtime):
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    return {
+        chunk['filename']: chunk.get('start', chunk['id'] * manifest['chunk_duration'])
+        for chunk in manifest['chunks']
+    }
+
+def chunk_start_time(video_id, chunks_dir, chunk_filename):
+    """
+    Media time at which a chunk file starts, from the video's manifest.json
+
+    Returns:
+        float: Start in seconds, or None if unknown
+    """
+    manifest_path = os.path.join(chunks_dir, video_id, 'manifest.json')
+    try:
+        mtime = os.path.getmtime(manifest_path)
+    except OSError:
+        return None
+    return _load_chunk_starts(manifest_path, mtime).get(chunk_filename)
+
+def plan_virtual_chunks(index, chunk_duration):
+    """
+    Group index fragments into chunks of roughly `chunk_duration` seconds
+
+    Like ffmpeg's segment muxer, a chunk is cut at the first fragment
+    (keyframe) at or after each multiple of chunk_duration.
+
+    Returns:
+        list: (first_fragment, last_fragment, start_time) tuples
+    """
+    fragments = index['fragments']
+    groups = []
+    boundary = 0.0
+    for i, fragment in enumerate(fragments):
+        if not groups or fragment['time'] >= boundary:
+            groups.append([i, i, fragment['time']])
+            while boundary <= fragment['time']:
+                boundary += chunk_duration
+        else:
+            groups[-1][1] = i
+    return [tuple(group) for group in groups]
+
+def calculate_range_hash(filepath, offset, length):
+    """Calculate SHA-256 hash of a byte range of a file"""
+    sha256_hash = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(1024 * 1024, remaining))
+            if not block:
+                break
+            sha256_hash.update(block)
+            remaining -= len(block)
+    return sha256_hash.hexdigest()
+
+def virtual_manifest_filename(chunk_duration):
+    """Cache file name for the manifest of a given chunk duration"""
+    return 'manifest.json' if chunk_duration == 5 else f'manifest_{chunk_duration}s.json'
+
+def generate_virtual_manifest(video_id, chunks_dir, chunk_duration=5):
+    """
+    Generate a manifest of range-addressable chunks from a fragment index
+
+    Chunks are byte ranges of one fragmented MP4 and are served from
+    /api/vchunks/{video_id}/{first}/{last}; the init segment (ftyp + moov)
+    is listed separately and must be loaded first, as in DASH/MSE.
+    The result is cached in the video's chunk directory per duration.
+
+    Returns:
+        dict: Manifest data
+    """
+    index = load_fragment_index(video_id, chunks_dir)
+    if index is None:
+        raise FileNotFoundError(f"Fragment index not found for video: {video_id}")
+
+    video_chunks_dir = os.path.join(chunks_dir, video_id)
+    media_path = os.path.join(video_chunks_dir, index['media'])
+    fragments = index['fragments']
+    groups = plan_virtual_chunks(index, chunk_duration)
+
+    manifest = {
+        'video_id': video_id,
+        'format': 'fmp4',
+        'total_chunks': len(groups),
+        'chunk_duration': chunk_duration,
+        'init': {
+            'size': index['init']['size'],
+            'hash': calculate_range_hash(media_path, 0, index['init']['size']),
+            'url': f'/api/vchunks/{video_id}/init'
+        },
+        'chunks': []
+    }
+
+    for idx, (first, last, start) in enumerate(groups):
+        offset = fragments[first]['offset']
+        size = fragments[last]['offset'] + fragments[last]['size'] - offset
+        end = groups[idx + 1][2] if idx + 1 < len(groups) else index['duration']
+
+        manifest['chunks'].append({
+            'id': idx,
+            'filename': f'chunk_{idx:03d}.m4s',
+            'hash': calculate_range_hash(media_path, offset, size),
+            'size': size,
+            'start': start,
+            'duration': round(max(end - start, 0), 6),
+            'url': f'/api/vchunks/{video_id}/{first}/{last}'
+        })
+
+    # Concurrent readers must never see a partial manifest
+    write_json_atomic(os.path.join(video_chunks_dir, virtual_manifest_filename(chunk_duration)), manifest)
+
+    return manifest
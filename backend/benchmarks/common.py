@@ -0,0 +1,119 @@
+"""
+Shared helpers for StreamSwarm benchmarks
+"""
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def generate_test_video(path: str, duration: int = 30, size: str = '1280x720', rate: int = 30):
+    """
+    Generate a synthetic H.264/AAC test video with ffmpeg's testsrc
+
+    A fixed GOP keeps the segment boundaries deterministic between runs.
+    """
+    if os.path.exists(path):
+        return path
+    command = [
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={size}:rate={rate}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(rate), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        path
+    ]
+    subprocess.run(command, check=True, capture_output=True, text=True)
+    return path
+
+
+@contextmanager
+def measure(result: dict, trace_memory: bool = True):
+    """
+    Record wall time, CPU time and (with trace_memory) Python heap high-water mark into `result`
+
+    tracemalloc hooks every allocation in every thread and can make
+    allocation-heavy code several times slower, so latency should be
+    measured in a separate pass with trace_memory=False.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield result
+    finally:
+        result['wall_seconds'] = round(time.perf_counter() - wall_start, 4)
+        result['cpu_seconds'] = round(time.process_time() - cpu_start, 4)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['python_peak_bytes'] = peak
+
+
+def latency_summary(samples: list) -> dict:
+    """Summarise a list of latencies (seconds) as milliseconds percentiles"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def max_rss_bytes() -> dict:
+    """Peak resident set size of this process and of waited-for children (ffmpeg)"""
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def write_results(results: dict, output_path: str = None) -> str:
+    """Write results as JSON, tagged with commit and environment info"""
+    commit = git_commit()
+    payload = {
+        'commit': commit,
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+    if output_path is None:
+        results_dir = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+        os.makedirs(results_dir, exist_ok=True)
+        output_path = os.path.join(results_dir, f"{commit}.json")
+    with open(output_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return output_path
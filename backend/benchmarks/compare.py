@@ -0,0 +1,77 @@
+"""
+Compare two benchmark result files
+
+Usage (from backend/):
+    python -m benchmarks.compare benchmarks/results/abc1234.json benchmarks/results/def5678.json
+
+Exits non-zero when any tracked metric regressed by more than --threshold.
+"""
+import argparse
+import json
+import sys
+
+# (benchmark, metric path, higher_is_better)
+TRACKED_METRICS = [
+    ('startup', ('median_ms',), False),
+    ('split_video', ('bytes_per_sec',), True),
+    ('generate_manifest', ('bytes_per_sec',), True),
+    ('get_manifest', ('latency', 'p95_ms'), False),
+    ('get_manifest', ('requests_per_sec',), True),
+    ('serve_chunk', ('latency', 'p95_ms'), False),
+    ('serve_chunk', ('bytes_per_sec',), True),
+    ('get_videos', ('latency', 'p95_ms'), False),
+    ('get_videos', ('python_peak_bytes',), False),
+]
+
+
+def _lookup(results, benchmark, path):
+    value = results.get(benchmark)
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(baseline, candidate, threshold):
+    """
+    Returns:
+        list: (name, baseline, candidate, change, regressed) rows
+    """
+    rows = []
+    for benchmark, path, higher_is_better in TRACKED_METRICS:
+        old = _lookup(baseline['results'], benchmark, path)
+        new = _lookup(candidate['results'], benchmark, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -threshold if higher_is_better else change > threshold
+        rows.append((f"{benchmark}.{'.'.join(path)}", old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare StreamSwarm benchmark results")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative change counted as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"Baseline {baseline['commit']}  →  candidate {candidate['commit']}")
+    rows = compare(baseline, candidate, args.threshold)
+    for name, old, new, change, regressed in rows:
+        marker = '❌' if regressed else '  '
+        print(f"{marker} {name:<40} {old:>16,.2f} {new:>16,.2f} {change:+8.1%}")
+
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
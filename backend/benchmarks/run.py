@@ -0,0 +1,244 @@
+"""
+StreamSwarm benchmark suite
+
+Measures split throughput, manifest hashing speed and API latency under
+concurrent load, and writes the results as JSON so runs on different
+commits can be compared with `python -m benchmarks.compare`.
+
+Usage (from backend/):
+    python -m benchmarks.run                          # mongomock, 30s test video
+    python -m benchmarks.run --mongo mongodb://localhost:27017/ --duration 120
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .common import (
+    BACKEND_DIR,
+    generate_test_video,
+    latency_summary,
+    max_rss_bytes,
+    measure,
+    write_results
+)
+from .startup import measure_startup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run StreamSwarm benchmarks")
+    parser.add_argument('--mongo', default='mongomock',
+                        help="'mongomock' or a MongoDB URI (a throwaway database is used)")
+    parser.add_argument('--duration', type=int, default=30, help="Test video duration in seconds")
+    parser.add_argument('--size', default='1280x720', help="Test video resolution")
+    parser.add_argument('--runs', type=int, default=3, help="Repetitions for split/manifest benchmarks")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent API clients")
+    parser.add_argument('--requests', type=int, default=400, help="Requests per API benchmark")
+    parser.add_argument('--catalog-size', type=int, default=1000, help="Videos seeded for /api/videos")
+    parser.add_argument('--workdir', default=None, help="Directory for test media (default: temp dir)")
+    parser.add_argument('--output', default=None, help="Results file (default: benchmarks/results/<commit>.json)")
+    return parser.parse_args()
+
+
+def setup_environment(workdir, mongo):
+    """Point storage at `workdir` and the database at mongomock or a bench DB"""
+    os.environ['VIDEOS_DIR'] = os.path.join(workdir, 'videos')
+    os.environ['CHUNKS_DIR'] = os.path.join(workdir, 'chunks')
+    os.environ['MANIFESTS_DIR'] = os.path.join(workdir, 'manifests')
+    # Throwaway database so a real deployment's data is never touched
+    os.environ['MONGODB_DB'] = f"streamswarm_bench_{os.getpid()}"
+
+    if mongo == 'mongomock':
+        import mongomock
+        import pymongo
+        # database.py imports MongoClient from pymongo, so patch before import
+        pymongo.MongoClient = mongomock.MongoClient
+    else:
+        os.environ['MONGODB_URI'] = mongo
+
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+def bench_split(video_path, chunks_dir, runs):
+    from splitting import split
+
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    source_bytes = os.path.getsize(video_path)
+    samples = []
+    result = {'source_bytes': source_bytes, 'runs': runs}
+    with measure(result):
+        for _ in range(runs):
+            shutil.rmtree(os.path.join(chunks_dir, video_name), ignore_errors=True)
+            start = time.perf_counter()
+            split.split_video(video_path, chunks_dir, chunk_duration=5)
+            samples.append(time.perf_counter() - start)
+    best = min(samples)
+    result['best_seconds'] = round(best, 4)
+    result['mean_seconds'] = round(sum(samples) / len(samples), 4)
+    result['bytes_per_sec'] = round(source_bytes / best, 1)
+    return result
+
+
+def bench_manifest(video_id, chunks_dir, runs):
+    from api.utils import generate_manifest
+
+    samples = []
+    result = {'runs': runs}
+    with measure(result):
+        for _ in range(runs):
+            start = time.perf_counter()
+            manifest = generate_manifest(video_id, chunks_dir)
+            samples.append(time.perf_counter() - start)
+    total_bytes = sum(chunk['size'] for chunk in manifest['chunks'])
+    best = min(samples)
+    result['total_chunks'] = manifest['total_chunks']
+    result['chunk_bytes'] = total_bytes
+    result['best_seconds'] = round(best, 4)
+    result['bytes_per_sec'] = round(total_bytes / best, 1)
+    return result, manifest
+
+
+def seed_database(db, video_id, manifest, catalog_size):
+    """Insert the processed test video plus `catalog_size` filler videos"""
+    db.save_video({
+        'video_id': video_id,
+        'filename': f"{video_id}.mp4",
+        'original_name': f"{video_id}.mp4",
+        'status': 'uploaded',
+        'total_chunks': 0,
+        'user_id': None
+    })
+    db.save_chunks(video_id, [dict(chunk) for chunk in manifest['chunks']])
+    db.update_video_status(
+        video_id,
+        'ready',
+        total_chunks=manifest['total_chunks'],
+        manifest_url=f'/api/manifest/{video_id}'
+    )
+    now = datetime.utcnow()
+    db.videos.insert_many([
+        {
+            'video_id': f"filler-{i:06d}",
+            'filename': f"filler-{i:06d}.mp4",
+            'original_name': f"filler {i}.mp4",
+            'status': 'ready' if i % 4 else 'processing',
+            'total_chunks': 120,
+            'user_id': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        for i in range(catalog_size)
+    ])
+
+
+def run_clients(app, paths, concurrency, total):
+    """Issue `total` GETs over `paths` from `concurrency` threads; returns (latencies, bytes)"""
+    per_worker = max(1, total // concurrency)
+
+    def worker(offset):
+        client = app.test_client()
+        samples = []
+        nbytes = 0
+        for i in range(per_worker):
+            path = paths[(offset + i) % len(paths)]
+            start = time.perf_counter()
+            response = client.get(path)
+            body = response.get_data()
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+            nbytes += len(body)
+            response.close()
+        return samples, nbytes
+
+    samples = []
+    nbytes = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for worker_samples, worker_bytes in pool.map(worker, range(concurrency)):
+            samples.extend(worker_samples)
+            nbytes += worker_bytes
+    return samples, nbytes
+
+
+def bench_endpoint(app, paths, concurrency, total):
+    """
+    Measure latency and throughput, then the heap high-water mark, of `total` GETs
+
+    The two are separate passes: tracemalloc would otherwise dominate the
+    latencies it is recorded alongside.
+    """
+    result = {'concurrency': concurrency}
+    with measure(result, trace_memory=False):
+        samples, nbytes = run_clients(app, paths, concurrency, total)
+    result['latency'] = latency_summary(samples)
+    result['requests_per_sec'] = round(len(samples) / result['wall_seconds'], 1)
+    result['bytes_per_sec'] = round(nbytes / result['wall_seconds'], 1)
+
+    memory = {}
+    with measure(memory):
+        run_clients(app, paths, concurrency, total)
+    result['python_peak_bytes'] = memory['python_peak_bytes']
+    return result
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='streamswarm-bench-')
+    setup_environment(workdir, args.mongo)
+
+    from api.utils import ensure_directories
+    ensure_directories()
+
+    video_id = f"bench-{args.duration}s-{args.size}"
+    video_path = os.path.join(os.environ['VIDEOS_DIR'], f"{video_id}.mp4")
+    chunks_dir = os.environ['CHUNKS_DIR']
+
+    print(f"🎞️  Generating {args.duration}s {args.size} test video in {workdir}")
+    generate_test_video(video_path, args.duration, args.size)
+
+    results = {'config': vars(args)}
+
+    print("⏱️  Measuring API startup time...")
+    results['startup'] = measure_startup()
+
+    print("✂️  Benchmarking split_video...")
+    results['split_video'] = bench_split(video_path, chunks_dir, args.runs)
+
+    print("#️⃣  Benchmarking generate_manifest...")
+    results['generate_manifest'], manifest = bench_manifest(video_id, chunks_dir, args.runs)
+
+    from api.app import create_app
+    from api.database import db
+
+    db.ensure_indexes()
+    seed_database(db, video_id, manifest, args.catalog_size)
+    app = create_app()
+
+    chunk_paths = [chunk['url'] for chunk in manifest['chunks']]
+    endpoints = {
+        'get_manifest': [f'/api/manifest/{video_id}'],
+        'serve_chunk': chunk_paths,
+        'get_videos': ['/api/videos']
+    }
+    for name, paths in endpoints.items():
+        print(f"🌐 Benchmarking {name} (concurrency={args.concurrency})...")
+        results[name] = bench_endpoint(app, paths, args.concurrency, args.requests)
+
+    results['max_rss_bytes'] = max_rss_bytes()
+
+    if args.mongo != 'mongomock':
+        db.client.drop_database(os.environ['MONGODB_DB'])
+    if args.workdir is None:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output_path = write_results(results, args.output)
+    print(f"✅ Results written to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
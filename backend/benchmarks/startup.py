@@ -0,0 +1,64 @@
+"""
+Startup-time budget check
+
+Measures, in fresh interpreters, how long it takes to import the API and
+build the app, with MONGODB_URI pointing at a closed port. Startup must
+not wait on MongoDB, so an unreachable database must not slow it down.
+
+Usage (from backend/):
+    python -m benchmarks.startup                  # default budget
+    python -m benchmarks.startup --budget-ms 200
+
+Exits non-zero when the median exceeds the budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from .common import BACKEND_DIR
+
+DEFAULT_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 500))
+
+_STARTUP_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "from api.app import create_app; create_app(); "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def measure_startup(runs: int = 5) -> dict:
+    """Median/max wall time (ms) of import + create_app over `runs` processes"""
+    env = dict(os.environ)
+    env['MONGODB_URI'] = 'mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=5000'
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SNIPPET],
+            cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(samples), 2),
+        'max_ms': round(max(samples), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check API startup time against a budget")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    result = measure_startup(args.runs)
+    within = result['median_ms'] <= args.budget_ms
+    marker = '✅' if within else '❌'
+    print(f"{marker} Startup median {result['median_ms']} ms (max {result['max_ms']} ms), budget {args.budget_ms} ms")
+    if not within:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
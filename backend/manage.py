@@ -0,0 +1,62 @@
+"""
+StreamSwarm management commands
+
+Usage:
+    python manage.py init      # create MongoDB indexes and storage directories
+    python manage.py reap      # reconcile storage with the database once
+    python manage.py reap --loop [--dry-run]
+
+Run `init` once per deployment (and after upgrades that add indexes).
+API and worker processes never touch indexes at startup, so they boot
+without waiting on MongoDB.
+"""
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def cmd_init(args):
+    """Create storage directories and MongoDB indexes"""
+    from api.database import db
+    from api.utils import ensure_directories
+
+    ensure_directories()
+    print("📁 Storage directories ready")
+
+    db.ensure_indexes()
+    print(f"🗂️  Indexes ensured on {db.db_name}")
+
+
+def cmd_reap(args):
+    """Clean up orphaned/partial storage and requeue or delete failed videos"""
+    from api.reaper import Reaper, run_forever
+
+    reaper = Reaper(dry_run=args.dry_run)
+    if args.loop:
+        run_forever(reaper)
+    else:
+        print(f"🧹 {reaper.run_once()}")
+
+
+COMMANDS = {
+    'init': cmd_init,
+    'reap': cmd_reap
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StreamSwarm management commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('init', help=cmd_init.__doc__)
+    reap_parser = subparsers.add_parser('reap', help=cmd_reap.__doc__)
+    reap_parser.add_argument('--loop', action='store_true',
+                             help="Keep running every REAPER_INTERVAL_SECONDS")
+    reap_parser.add_argument('--dry-run', action='store_true',
+                             help="Only report what would be removed, requeued or deleted")
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+
+from .split import probe_duration, staged_output_dir
+
+
+def _iter_boxes(f, start: int, end: int):
+    """Yield (type, offset, header_size, size) for boxes in [start, end)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise ValueError(f"Corrupt MP4 box {box_type!r} at offset {offset}")
+        yield box_type, offset, header_size, size
+        offset += size
+
+
+def _read_payload(f, offset: int, header_size: int, size: int) -> bytes:
+    f.seek(offset + header_size)
+    return f.read(size - header_size)
+
+
+def _parse_tracks(f, moov_offset: int, moov_header: int, moov_size: int) -> dict:
+    """Return {track_id: {'timescale': int, 'handler': str}} from a moov box"""
+    tracks = {}
+    for box_type, offset, header_size, size in _iter_boxes(f, moov_offset + moov_header, moov_offset + moov_size):
+        if box_type != b'trak':
+            continue
+        track = {}
+        for child, c_offset, c_header, c_size in _iter_boxes(f, offset + header_size, offset + size):
+            if child == b'tkhd':
+                payload = _read_payload(f, c_offset, c_header, c_size)
+                # version(1) flags(3) creation/modification times (4 or 8 each) track_id(4)
+                id_offset = 20 if payload[0] == 1 else 12
+                track['track_id'] = struct.unpack('>I', payload[id_offset:id_offset + 4])[0]
+            elif child == b'mdia':
+                for m_child, m_offset, m_header, m_size in _iter_boxes(f, c_offset + c_header, c_offset + c_size):
+                    payload = _read_payload(f, m_offset, m_header, m_size) if m_child in (b'mdhd', b'hdlr') else None
+                    if m_child == b'mdhd':
+                        ts_offset = 20 if payload[0] == 1 else 12
+                        track['timescale'] = struct.unpack('>I', payload[ts_offset:ts_offset + 4])[0]
+                    elif m_child == b'hdlr':
+                        track['handler'] = payload[8:12].decode('ascii', 'replace')
+        if 'track_id' in track and 'timescale' in track:
+            tracks[track['track_id']] = track
+    return tracks
+
+
+# sample_is_non_sync_sample in ISO/IEC 14496-12 sample flags
+SAMPLE_IS_NON_SYNC = 0x00010000
+
+
+def _trex_sample_flags(f, moov_offset: int, moov_header: int, moov_size: int) -> dict:
+    """Return {track_id: default_sample_flags} from the moov's mvex/trex boxes"""
+    defaults = {}
+    for box_type, offset, header_size, size in _iter_boxes(f, moov_offset + moov_header, moov_offset + moov_size):
+        if box_type != b'mvex':
+            continue
+        for child, c_offset, c_header, c_size in _iter_boxes(f, offset + header_size, offset + size):
+            if child == b'trex':
+                payload = _read_payload(f, c_offset, c_header, c_size)
+                # version/flags, track_ID, description index, duration, size, flags
+                track_id, flags = struct.unpack('>I12xI', payload[4:24])
+                defaults[track_id] = flags
+    return defaults
+
+
+def _first_sample_flags(f, traf_offset: int, traf_header: int, traf_size: int, trex_flags: dict):
+    """
+    Return (track_id, flags of the fragment's first sample) from a traf box
+
+    The flags come from the first trun (first_sample_flags or the first
+    sample's own flags), else tfhd's default_sample_flags, else trex's.
+    Flags are None when the traf has no samples.
+    """
+    track_id = None
+    default_flags = None
+    for child, c_offset, c_header, c_size in _iter_boxes(f, traf_offset + traf_header, traf_offset + traf_size):
+        payload = _read_payload(f, c_offset, c_header, c_size) if child in (b'tfhd', b'trun') else None
+        if child == b'tfhd':
+            tf_flags = struct.unpack('>I', payload[:4])[0] & 0xFFFFFF
+            track_id = struct.unpack('>I', payload[4:8])[0]
+            pos = 8
+            for flag, field_size in ((0x01, 8), (0x02, 4), (0x08, 4), (0x10, 4)):
+                if tf_flags & flag:
+                    pos += field_size
+            if tf_flags & 0x20:
+                default_flags = struct.unpack('>I', payload[pos:pos + 4])[0]
+        elif child == b'trun':
+            tr_flags = struct.unpack('>I', payload[:4])[0] & 0xFFFFFF
+            sample_count = struct.unpack('>I', payload[4:8])[0]
+            if sample_count == 0:
+                return track_id, None
+            pos = 8 + (4 if tr_flags & 0x01 else 0)
+            if tr_flags & 0x04:
+                return track_id, struct.unpack('>I', payload[pos:pos + 4])[0]
+            if tr_flags & 0x400:
+                # Per-sample record: duration?, size?, flags, composition offset?
+                pos += 4 * bool(tr_flags & 0x100) + 4 * bool(tr_flags & 0x200)
+                return track_id, struct.unpack('>I', payload[pos:pos + 4])[0]
+            if default_flags is None:
+                default_flags = trex_flags.get(track_id)
+            return track_id, default_flags
+    return track_id, None
+
+
+def starts_on_keyframes(path: str) -> bool:
+    """
+    True if every fragment of a fragmented MP4 starts on a video keyframe
+
+    Fragments cut by duration (e.g. ffmpeg's frag_duration) can start
+    mid-GOP, and chunks made of them would not decode on their own.
+    Fragments without a video track run are ignored; one whose first-sample
+    flags can't be determined counts as not starting on a keyframe.
+    """
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            video_track = None
+            trex_flags = {}
+            fragmented = False
+            for box_type, offset, header_size, size in _iter_boxes(f, 0, file_size):
+                if box_type == b'moov':
+                    tracks = _parse_tracks(f, offset, header_size, size)
+                    video_tracks = [tid for tid, t in tracks.items() if t.get('handler') == 'vide']
+                    if not video_tracks:
+                        # Every audio sample is a sync sample
+                        return bool(tracks)
+                    video_track = video_tracks[0]
+                    trex_flags = _trex_sample_flags(f, offset, header_size, size)
+                elif box_type == b'moof':
+                    if video_track is None:
+                        return False
+                    fragmented = True
+                    for child, c_offset, c_header, c_size in _iter_boxes(f, offset + header_size, offset + size):
+                        if child != b'traf':
+                            continue
+                        track_id, flags = _first_sample_flags(f, c_offset, c_header, c_size, trex_flags)
+                        if track_id == video_track and (flags is None or flags & SAMPLE_IS_NON_SYNC):
+                            return False
+            return fragmented
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+def _fragment_times(f, moof_offset: int, moof_header: int, moof_size: int) -> dict:
+    """Return {track_id: base_media_decode_time} from a moof box"""
+    times = {}
+    for box_type, offset, header_size, size in _iter_boxes(f, moof_offset + moof_header, moof_offset + moof_size):
+        if box_type != b'traf':
+            continue
+        track_id = None
+        base_time = None
+        for child, c_offset, c_header, c_size in _iter_boxes(f, offset + header_size, offset + size):
+            if child == b'tfhd':
+                payload = _read_payload(f, c_offset, c_header, c_size)
+                track_id = struct.unpack('>I', payload[4:8])[0]
+            elif child == b'tfdt':
+                payload = _read_payload(f, c_offset, c_header, c_size)
+                if payload[0] == 1:
+                    base_time = struct.unpack('>Q', payload[4:12])[0]
+                else:
+                    base_time = struct.unpack('>I', payload[4:8])[0]
+        if track_id is not None and base_time is not None:
+            times[track_id] = base_time
+    return times
+
+
+def is_fragmented_mp4(path: str) -> bool:
+    """True if the file is an MP4 with top-level moof boxes"""
+    try:
+        with open(path, 'rb') as f:
+            end = os.fstat(f.fileno()).st_size
+            return any(box_type == b'moof' for box_type, *_ in _iter_boxes(f, 0, end))
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+def build_fragment_index(path: str) -> dict:
+    """
+    Build a byte-offset/keyframe index of a fragmented MP4
+
+    Every fragment starts on a video keyframe, so any run of consecutive
+    fragments is an independently decodable byte range once the init
+    segment (ftyp + moov) has been loaded.
+
+    Returns:
+        dict: {
+            'file_size': int,
+            'init': {'offset': 0, 'size': int},
+            'duration': float,
+            'fragments': [{'offset': int, 'size': int, 'time': float}]
+        }
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        tracks = {}
+        moofs = []
+        media_end = file_size
+        for box_type, offset, header_size, size in _iter_boxes(f, 0, file_size):
+            if box_type == b'moov':
+                tracks = _parse_tracks(f, offset, header_size, size)
+            elif box_type == b'moof':
+                moofs.append((offset, _fragment_times(f, offset, header_size, size)))
+            elif box_type == b'mfra':
+                # Random access trailer, not part of any fragment
+                media_end = offset
+
+    if not moofs:
+        raise ValueError(f"Not a fragmented MP4: {path}")
+    if not tracks:
+        raise ValueError(f"No tracks found in moov: {path}")
+
+    video_tracks = [tid for tid, t in tracks.items() if t.get('handler') == 'vide']
+    reference = video_tracks[0] if video_tracks else next(iter(tracks))
+    timescale = tracks[reference]['timescale']
+
+    fragments = []
+    for i, (offset, times) in enumerate(moofs):
+        end = moofs[i + 1][0] if i + 1 < len(moofs) else media_end
+        base_time = times.get(reference)
+        if base_time is None:
+            # Fragment without the reference track: inherit the previous time
+            time_sec = fragments[-1]['time'] if fragments else 0.0
+        else:
+            time_sec = base_time / timescale
+        fragments.append({'offset': offset, 'size': end - offset, 'time': time_sec})
+
+    start_time = fragments[0]['time']
+    for fragment in fragments:
+        fragment['time'] = round(fragment['time'] - start_time, 6)
+
+    return {
+        'file_size': file_size,
+        'init': {'offset': 0, 'size': moofs[0][0]},
+        'duration': round(probe_duration(path), 6),
+        'fragments': fragments
+    }
+
+
+def index_video(
+    input_video: str,
+    base_output_dir: str = "/home/ubuntu/share/videos/chunks",
+    media_filename: str = "stream.mp4"
+) -> dict:
+    """
+    Prepare a video for range-addressable (virtual) chunks
+
+    The source is remuxed once into a fragmented MP4 with a fragment at
+    every keyframe (hard-linked instead when it already is a fragmented
+    MP4 whose fragments all start on keyframes), and a
+    fragment index is written next to it as index.json. Chunks of any
+    duration can then be served as byte ranges without re-running ffmpeg.
+
+    Returns:
+        dict: The fragment index
+    """
+    video_name = os.path.splitext(os.path.basename(input_video))[0]
+
+    with staged_output_dir(base_output_dir, video_name) as output_dir:
+        media_path = os.path.join(output_dir, media_filename)
+
+        if is_fragmented_mp4(input_video) and starts_on_keyframes(input_video):
+            try:
+                os.link(input_video, media_path)
+            except OSError:
+                shutil.copyfile(input_video, media_path)
+        else:
+            command = [
+                "ffmpeg",
+                "-i", input_video,
+                "-c", "copy",
+                "-map", "0",
+                "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                "-f", "mp4",
+                media_path
+            ]
+            try:
+                subprocess.run(command, check=True, capture_output=True, text=True)
+            except subprocess.CalledProcessError as e:
+                print(f"Failed to remux video {video_name}. Error: {e.stderr}")
+                raise e
+
+        index = build_fragment_index(media_path)
+        index['media'] = media_filename
+        with open(os.path.join(output_dir, 'index.json'), 'w') as f:
+            json.dump(index, f)
+    print(f"Fragment index saved for {video_name} ({len(index['fragments'])} fragments)")
+    return index
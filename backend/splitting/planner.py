@@ -0,0 +1,128 @@
+import subprocess
+from typing import List, Optional, Tuple
+
+
+def probe_packets(input_video: str) -> List[Tuple[float, int, bool]]:
+    """
+    List every packet of a video as (time, size, is_video_keyframe)
+
+    Uses a single ffprobe pass over the packet headers; nothing is decoded.
+    """
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "packet=codec_type,pts_time,dts_time,size,flags",
+        "-of", "compact",
+        input_video
+    ]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to probe packets for {input_video}. Error: {e.stderr}")
+        raise e
+
+    packets = []
+    for line in result.stdout.splitlines():
+        if not line.startswith("packet|"):
+            continue
+        fields = dict(item.split("=", 1) for item in line.split("|")[1:] if "=" in item)
+        time_str = fields.get("pts_time", "N/A")
+        if time_str == "N/A":
+            time_str = fields.get("dts_time", "N/A")
+        if time_str == "N/A":
+            continue
+        is_keyframe = fields.get("codec_type") == "video" and fields.get("flags", "").startswith("K")
+        packets.append((float(time_str), int(fields.get("size", 0)), is_keyframe))
+
+    packets.sort(key=lambda packet: packet[0])
+    return packets
+
+
+def group_into_gops(packets: List[Tuple[float, int, bool]]) -> List[Tuple[float, int]]:
+    """
+    Collapse packets into (start_time, total_bytes) per keyframe interval
+
+    Audio and other streams are attributed to the GOP they are muxed with,
+    so the byte counts match what a segment cut at the keyframe contains.
+    """
+    gops = []
+    for time, size, is_keyframe in packets:
+        if is_keyframe or not gops:
+            gops.append([time, 0])
+        gops[-1][1] += size
+    return [(start, size) for start, size in gops]
+
+
+def plan_segments(
+    gops: List[Tuple[float, int]],
+    duration: float,
+    target_bytes: int = 2 * 1024 * 1024,
+    min_duration: float = 2.0,
+    max_duration: float = 10.0
+) -> List[float]:
+    """
+    Choose segment boundaries (keyframe times) that keep segments near target_bytes
+
+    A segment is closed before the next GOP when adding it would move the
+    segment further from target_bytes than it already is, or would push it
+    past max_duration. Segments shorter than min_duration are never closed
+    early, so a GOP longer than max_duration still forms its own segment.
+
+    Returns:
+        list: Boundary times in seconds, excluding 0
+    """
+    boundaries = []
+    if not gops:
+        return boundaries
+
+    seg_start, seg_bytes = gops[0][0], gops[0][1]
+    for i in range(1, len(gops)):
+        gop_start, gop_bytes = gops[i]
+        gop_end = gops[i + 1][0] if i + 1 < len(gops) else duration
+        seg_duration = gop_start - seg_start
+
+        if seg_duration >= min_duration:
+            overshoots = abs(seg_bytes + gop_bytes - target_bytes) > abs(seg_bytes - target_bytes)
+            too_long = gop_end - seg_start > max_duration
+            if overshoots or too_long:
+                boundaries.append(gop_start)
+                seg_start, seg_bytes = gop_start, 0
+
+        seg_bytes += gop_bytes
+
+    return boundaries
+
+
+def plan_adaptive_segments(
+    input_video: str,
+    target_bytes: int = 2 * 1024 * 1024,
+    min_duration: float = 2.0,
+    max_duration: float = 10.0
+) -> Optional[dict]:
+    """
+    Plan content-aware segment boundaries for a video
+
+    Returns:
+        dict: {
+            'segment_times': [float],   # boundaries for ffmpeg -segment_times
+            'duration': float,
+            'target_bytes': int
+        }
+        or None if the video has no usable keyframes
+    """
+    packets = probe_packets(input_video)
+    if not packets or not any(is_keyframe for _, _, is_keyframe in packets):
+        return None
+
+    # Packets before the first keyframe belong to the first segment
+    first_keyframe = next(i for i, packet in enumerate(packets) if packet[2])
+    leading_bytes = sum(size for _, size, _ in packets[:first_keyframe])
+    gops = group_into_gops(packets[first_keyframe:])
+    gops[0] = (gops[0][0], gops[0][1] + leading_bytes)
+
+    duration = packets[-1][0]
+    return {
+        'segment_times': plan_segments(gops, duration, target_bytes, min_duration, max_duration),
+        'duration': duration,
+        'target_bytes': target_bytes
+    }
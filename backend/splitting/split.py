@@ -1,30 +1,227 @@
+import json
+import math
 import os
+import shutil
 import subprocess
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+STAGING_SUFFIX = ".partial"
+
+THUMBNAIL_SPRITE_PATTERN = "sprite_%03d.jpg"
+THUMBNAIL_VTT = "thumbnails.vtt"
+THUMBNAIL_INDEX = "thumbnails.json"
+
+@contextmanager
+def staged_output_dir(base_output_dir: str, video_name: str):
+    """
+    Yield a private staging directory that replaces base_output_dir/video_name on success
+
+    Output is written to a hidden sibling directory and renamed into place
+    only once complete, so the final directory either does not exist or is
+    complete, even if the process crashes midway. On error the staging
+    directory is removed; anything left by a crash is cleaned up by the
+    storage reaper (hidden *.partial directories).
+    """
+    os.makedirs(base_output_dir, exist_ok=True)
+    output_dir = os.path.join(base_output_dir, video_name)
+    staging_dir = os.path.join(base_output_dir, f".{video_name}.{uuid.uuid4().hex[:8]}{STAGING_SUFFIX}")
+    os.makedirs(staging_dir)
+    try:
+        yield staging_dir
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # Directories can't be atomically replaced when the target exists, so
+    # move any previous output aside first and delete it afterwards
+    previous_dir = None
+    if os.path.exists(output_dir):
+        previous_dir = f"{staging_dir}.old"
+        os.rename(output_dir, previous_dir)
+    os.rename(staging_dir, output_dir)
+    if previous_dir:
+        shutil.rmtree(previous_dir, ignore_errors=True)
+
+def probe_duration(path: str) -> float:
+    """Container duration in seconds, via ffprobe"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.strip() or 0)
+
+def _probe_frame_size(path: str):
+    """(width, height) of the first video stream, via ffprobe"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height", "-of", "csv=p=0:s=x", path],
+        check=True, capture_output=True, text=True
+    )
+    width, height = result.stdout.strip().split("x")
+    return int(width), int(height)
+
+def _vtt_timestamp(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+def thumbnail_output_args(
+    output_dir: str,
+    interval: float,
+    width: int = 160,
+    columns: int = 5,
+    rows: int = 5
+) -> List[str]:
+    """
+    ffmpeg output options that write seek-preview sprite sheets
+
+    Meant to be appended to another ffmpeg command on the same input, so
+    the source is read once: one frame every `interval` seconds, scaled to
+    `width` pixels wide and tiled columns x rows per JPEG sheet. Inputs
+    without a video stream simply produce no sheets.
+    """
+    return [
+        "-map", "0:v:0?",
+        "-vf", f"fps=1/{interval},scale={width}:-2,tile={columns}x{rows}",
+        "-q:v", "5",
+        "-f", "image2",
+        "-start_number", "0",
+        os.path.join(output_dir, THUMBNAIL_SPRITE_PATTERN)
+    ]
+
+def write_thumbnail_index(
+    output_dir: str,
+    duration: float,
+    interval: float,
+    columns: int = 5,
+    rows: int = 5
+) -> Optional[dict]:
+    """
+    Describe the sprite sheets in output_dir as WebVTT and JSON
+
+    thumbnails.vtt is the usual seek-preview track (one cue per thumbnail,
+    pointing at sprite_NNN.jpg#xywh=x,y,w,h); thumbnails.json carries the
+    same cues for players that don't read WebVTT.
+
+    Returns:
+        dict: The JSON index, or None when no sheets were produced
+    """
+    interval = float(interval)
+    sprites = sorted(
+        f for f in os.listdir(output_dir)
+        if f.startswith("sprite_") and f.endswith(".jpg")
+    )
+    if not sprites:
+        return None
+
+    sheet_width, sheet_height = _probe_frame_size(os.path.join(output_dir, sprites[0]))
+    tile_width, tile_height = sheet_width // columns, sheet_height // rows
+    per_sheet = columns * rows
+    count = min(max(math.ceil(duration / interval), 1), len(sprites) * per_sheet)
+
+    cues = []
+    vtt_lines = ["WEBVTT", ""]
+    for i in range(count):
+        start = i * interval
+        end = min((i + 1) * interval, duration) if duration > start else start + interval
+        sprite = sprites[i // per_sheet]
+        x = (i % per_sheet) % columns * tile_width
+        y = (i % per_sheet) // columns * tile_height
+        cues.append({
+            'start': round(start, 3),
+            'end': round(end, 3),
+            'sprite': sprite,
+            'x': x,
+            'y': y
+        })
+        vtt_lines += [
+            f"{_vtt_timestamp(start)} --> {_vtt_timestamp(end)}",
+            f"{sprite}#xywh={x},{y},{tile_width},{tile_height}",
+            ""
+        ]
+
+    index = {
+        'interval': interval,
+        'width': tile_width,
+        'height': tile_height,
+        'columns': columns,
+        'rows': rows,
+        'sprites': sprites,
+        'cues': cues
+    }
+    with open(os.path.join(output_dir, THUMBNAIL_VTT), "w") as f:
+        f.write("\n".join(vtt_lines))
+    with open(os.path.join(output_dir, THUMBNAIL_INDEX), "w") as f:
+        json.dump(index, f)
+    return index
 
 def split_video(
     input_video: str,
     base_output_dir: str = "/home/ubuntu/share/videos/chunks",
-    chunk_duration: int = 5
+    chunk_duration: int = 5,
+    segment_times: Optional[List[float]] = None,
+    thumbnail_interval: Optional[float] = None,
+    thumbnail_width: int = 160,
+    sprite_columns: int = 5,
+    sprite_rows: int = 5
 ):
+    """
+    Split a video into stream-copied chunks
+
+    Chunks are chunk_duration seconds long unless segment_times gives the
+    boundaries to cut at; an empty list means a single chunk.
+
+    With thumbnail_interval set, the same ffmpeg run also writes seek-preview
+    sprite sheets (see thumbnail_output_args) plus thumbnails.vtt and
+    thumbnails.json into the chunk directory, so previews cost no second
+    read of the source.
+    """
     video_name = os.path.splitext(os.path.basename(input_video))[0]
-    output_dir = os.path.join(base_output_dir, video_name)
-    os.makedirs(output_dir, exist_ok=True)
-
-    output_pattern = os.path.join(output_dir, "chunk_%03d.mp4")
-
-    command = [
-        "ffmpeg",
-        "-i", input_video,
-        "-c", "copy",
-        "-map", "0",
-        "-f", "segment",
-        "-segment_time", str(chunk_duration),
-        output_pattern
-    ]
 
-    try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
-        print(f"Chunks saved for {video_name}")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to split video {video_name}. Error: {e.stderr}")
-        raise e
+    if segment_times:
+        # Explicit boundaries (e.g. from planner.plan_adaptive_segments). They
+        # are keyframe times, so nudge them back by 1ms to make sure ffmpeg
+        # cuts at that keyframe and not the next one after rounding.
+        segment_args = ["-segment_times", ",".join(f"{max(t - 0.001, 0):.3f}" for t in segment_times)]
+    elif segment_times is not None:
+        # A plan with no boundaries keeps the whole video in one chunk; the
+        # segment muxer has no way to say that except a segment it never ends
+        segment_args = ["-segment_time", "1000000000"]
+    else:
+        segment_args = ["-segment_time", str(chunk_duration)]
+
+    with staged_output_dir(base_output_dir, video_name) as output_dir:
+        output_pattern = os.path.join(output_dir, "chunk_%03d.mp4")
+
+        command = [
+            "ffmpeg",
+            "-i", input_video,
+            "-c", "copy",
+            "-map", "0",
+            "-f", "segment",
+            *segment_args,
+            output_pattern
+        ]
+        if thumbnail_interval:
+            command += thumbnail_output_args(
+                output_dir, thumbnail_interval, thumbnail_width, sprite_columns, sprite_rows
+            )
+
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True)
+            print(f"Chunks saved for {video_name}")
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to split video {video_name}. Error: {e.stderr}")
+            raise e
+
+        if thumbnail_interval:
+            index = write_thumbnail_index(
+                output_dir, probe_duration(input_video), thumbnail_interval, sprite_columns, sprite_rows
+            )
+            if index:
+                print(f"Thumbnails saved for {video_name} ({len(index['cues'])} in {len(index['sprites'])} sprites)")
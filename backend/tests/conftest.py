@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import api/ and splitting/ the way the app does, from backend/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
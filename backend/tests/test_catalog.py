@@ -0,0 +1,136 @@
+"""
+CatalogSnapshot indexes, paging and refresh against a mongomock collection
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from api import catalog as catalog_module
+from api.catalog import CatalogSnapshot
+
+T0 = datetime(2024, 1, 1)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.videos = mongomock.MongoClient().db.videos
+
+
+def video(n, status='ready', user_id=None, updated_at=None, **fields):
+    created_at = T0 + timedelta(minutes=n)
+    doc = {
+        'video_id': f'v{n}',
+        'filename': f'v{n}.mp4',
+        'original_name': f'video {n}.mp4',
+        'status': status,
+        'user_id': user_id,
+        'created_at': created_at,
+        'updated_at': updated_at or created_at
+    }
+    doc.update(fields)
+    return doc
+
+
+def ids(body):
+    return [v['video_id'] for v in json.loads(body)['videos']]
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.videos.insert_many([
+        video(1, user_id='alice'),
+        video(2, status='processing', user_id='bob'),
+        video(3, user_id='bob'),
+        video(4, status='failed'),
+        video(5, user_id='alice')
+    ])
+    return database
+
+
+def test_sorting_and_filters(database):
+    snapshot = CatalogSnapshot(database)
+
+    assert ids(snapshot.get_page()[0]) == ['v5', 'v4', 'v3', 'v2', 'v1']
+    assert ids(snapshot.get_page(sort='oldest')[0]) == ['v1', 'v2', 'v3', 'v4', 'v5']
+    assert ids(snapshot.get_page(status='ready')[0]) == ['v5', 'v3', 'v1']
+    assert ids(snapshot.get_page(user_id='bob')[0]) == ['v3', 'v2']
+    assert ids(snapshot.get_page(status='ready', user_id='bob')[0]) == ['v3']
+    assert ids(snapshot.get_page(status='uploaded')[0]) == []
+
+
+def test_paging(database):
+    snapshot = CatalogSnapshot(database)
+
+    body = json.loads(snapshot.get_page(page=1, per_page=2)[0])
+    assert [v['video_id'] for v in body['videos']] == ['v5', 'v4']
+    assert (body['page'], body['per_page'], body['total']) == (1, 2, 5)
+    assert ids(snapshot.get_page(page=3, per_page=2)[0]) == ['v1']
+    assert ids(snapshot.get_page(page=4, per_page=2)[0]) == []
+    # Oldest first pages from the other end of the same index
+    assert ids(snapshot.get_page(sort='oldest', page=1, per_page=2)[0]) == ['v1', 'v2']
+    assert ids(snapshot.get_page(sort='oldest', page=3, per_page=2)[0]) == ['v5']
+    assert json.loads(snapshot.get_page(status='ready', page=1, per_page=2)[0])['total'] == 3
+
+
+def test_private_fields_are_not_published(database):
+    database.videos.insert_one(video(6, sha256='abc', source_video_id='v1'))
+    snapshot = CatalogSnapshot(database)
+
+    published = json.loads(snapshot.get_page()[0])['videos'][0]
+    assert published['video_id'] == 'v6'
+    for field in ('filename', 'sha256', 'source_video_id'):
+        assert field not in published
+    assert published['created_at'] == (T0 + timedelta(minutes=6)).isoformat()
+
+
+def test_refresh_applies_updates_and_moves_indexes(database):
+    snapshot = CatalogSnapshot(database)
+    body, etag = snapshot.get_page(status='ready')
+    assert snapshot.get_page(status='ready') == (body, etag)
+
+    database.videos.update_one({'video_id': 'v2'}, {'$set': {'status': 'ready', 'updated_at': T0 + timedelta(hours=1)}})
+    database.videos.insert_one(video(7, user_id='bob', updated_at=T0 + timedelta(hours=1)))
+    snapshot.mark_dirty('v2')
+
+    body, new_etag = snapshot.get_page(status='ready')
+    assert new_etag != etag
+    assert ids(body) == ['v7', 'v5', 'v3', 'v2', 'v1']
+    assert ids(snapshot.get_page(status='processing')[0]) == []
+    assert ids(snapshot.get_page(user_id='bob')[0]) == ['v7', 'v3', 'v2']
+
+
+def test_refresh_rereads_writes_stamped_before_the_watermark(database, monkeypatch):
+    monkeypatch.setattr(catalog_module, 'REFRESH_OVERLAP_SECONDS', 10)
+    snapshot = CatalogSnapshot(database)
+    snapshot.get_page()
+
+    # A fast writer moves the watermark on...
+    database.videos.update_one({'video_id': 'v5'}, {'$set': {'updated_at': T0 + timedelta(hours=1, seconds=5)}})
+    snapshot.refresh(force=True)
+    # ...then a write stamped earlier (slow commit, or a clock running
+    # behind) becomes visible
+    database.videos.update_one({'video_id': 'v2'}, {'$set': {'status': 'ready', 'updated_at': T0 + timedelta(hours=1)}})
+    snapshot.refresh(force=True)
+
+    assert 'v2' in ids(snapshot.get_page(status='ready')[0])
+
+
+def test_deletions_are_applied_locally_and_on_full_reload(database, monkeypatch):
+    snapshot = CatalogSnapshot(database)
+    snapshot.get_page()
+
+    database.videos.delete_one({'video_id': 'v3'})
+    snapshot.mark_dirty('v3', deleted=True)
+    assert ids(snapshot.get_page(user_id='bob')[0]) == ['v2']
+
+    # Deleted by another process: only a full reload notices
+    database.videos.delete_one({'video_id': 'v1'})
+    snapshot.refresh(force=True)
+    assert 'v1' in ids(snapshot.get_page()[0])
+    monkeypatch.setattr(catalog_module, 'FULL_RELOAD_SECONDS', 0)
+    snapshot.refresh(force=True)
+    assert ids(snapshot.get_page()[0]) == ['v5', 'v4', 'v2']
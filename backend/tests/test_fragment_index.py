@@ -0,0 +1,199 @@
+"""
+build_fragment_index on a hand-built fragmented MP4
+
+The fixture has an init segment (ftyp + moov with a video track at
+timescale 1000 and an audio track at 48000), three moof/mdat fragments
+and an mfra trailer, so offsets and times can be checked exactly without
+ffmpeg. Further fixtures carry trun/tfhd/trex sample flags for the check
+that already-fragmented uploads start every fragment on a keyframe.
+"""
+import struct
+
+import pytest
+
+from splitting import fragment_index
+
+VIDEO_TRACK = 1
+AUDIO_TRACK = 2
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, version, payload):
+    return box(box_type, struct.pack('>B3x', version) + payload)
+
+
+def trak(track_id, timescale, handler):
+    tkhd = full_box(b'tkhd', 0, struct.pack('>III', 0, 0, track_id) + bytes(68))
+    mdhd = full_box(b'mdhd', 0, struct.pack('>IIII', 0, 0, timescale, 0) + bytes(4))
+    hdlr = full_box(b'hdlr', 0, struct.pack('>I4s', 0, handler) + bytes(12) + b'\0')
+    return box(b'trak', tkhd + box(b'mdia', mdhd + hdlr))
+
+
+def traf(track_id, base_time, version=1):
+    tfhd = full_box(b'tfhd', 0, struct.pack('>I', track_id))
+    time_field = struct.pack('>Q', base_time) if version == 1 else struct.pack('>I', base_time)
+    return box(b'traf', tfhd + full_box(b'tfdt', version, time_field))
+
+
+def fragment(video_time, audio_time, payload_size, tfdt_version=1):
+    moof = box(b'moof', full_box(b'mfhd', 0, struct.pack('>I', 1))
+               + traf(VIDEO_TRACK, video_time, tfdt_version)
+               + traf(AUDIO_TRACK, audio_time, tfdt_version))
+    return moof + box(b'mdat', bytes(payload_size))
+
+
+@pytest.fixture
+def fmp4(tmp_path, monkeypatch):
+    monkeypatch.setattr(fragment_index, 'probe_duration', lambda path: 6.0)
+    init = box(b'ftyp', b'isom' + bytes(4)) + box(b'moov', trak(VIDEO_TRACK, 1000, b'vide') + trak(AUDIO_TRACK, 48000, b'soun'))
+    # Audio starts earlier than video, so audio times must not be used
+    fragments = [
+        fragment(1000, 0, 100),
+        fragment(3000, 96000, 250, tfdt_version=0),
+        fragment(5000, 192000, 50)
+    ]
+    data = init + b''.join(fragments) + box(b'mfra', bytes(8))
+    path = tmp_path / 'stream.mp4'
+    path.write_bytes(data)
+    return path, init, fragments
+
+
+def test_fragment_offsets_sizes_and_times(fmp4):
+    path, init, fragments = fmp4
+    index = fragment_index.build_fragment_index(str(path))
+
+    assert index['init'] == {'offset': 0, 'size': len(init)}
+    assert index['duration'] == 6.0
+    offsets = [len(init) + sum(len(f) for f in fragments[:i]) for i in range(len(fragments))]
+    assert [f['offset'] for f in index['fragments']] == offsets
+    # The mfra trailer is excluded from the last fragment
+    assert [f['size'] for f in index['fragments']] == [len(f) for f in fragments]
+    # Video track times, rebased to the first fragment
+    assert [f['time'] for f in index['fragments']] == [0.0, 2.0, 4.0]
+
+
+def test_is_fragmented_mp4(fmp4, tmp_path):
+    path, init, _ = fmp4
+    assert fragment_index.is_fragmented_mp4(str(path))
+
+    progressive = tmp_path / 'progressive.mp4'
+    progressive.write_bytes(init + box(b'mdat', bytes(10)))
+    assert not fragment_index.is_fragmented_mp4(str(progressive))
+    with pytest.raises(ValueError):
+        fragment_index.build_fragment_index(str(progressive))
+
+
+def test_corrupt_box_size_is_rejected(tmp_path):
+    path = tmp_path / 'corrupt.mp4'
+    path.write_bytes(struct.pack('>I4s', 4, b'moof') + bytes(8))
+    with pytest.raises(ValueError):
+        fragment_index.build_fragment_index(str(path))
+
+
+def test_64bit_box_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(fragment_index, 'probe_duration', lambda path: 2.0)
+    init = box(b'ftyp', b'isom' + bytes(4)) + box(b'moov', trak(VIDEO_TRACK, 1000, b'vide'))
+    moof = box(b'moof', traf(VIDEO_TRACK, 0))
+    large_mdat = struct.pack('>I4sQ', 1, b'mdat', 16 + 32) + bytes(32)
+    path = tmp_path / 'large.mp4'
+    path.write_bytes(init + moof + large_mdat)
+
+    index = fragment_index.build_fragment_index(str(path))
+    assert index['fragments'] == [{'offset': len(init), 'size': len(moof) + len(large_mdat), 'time': 0.0}]
+
+
+SYNC = 0x02000000        # sample_depends_on = 2 (an I-frame)
+NON_SYNC = 0x01010000    # depends on others, sample_is_non_sync_sample
+
+
+def trun(first_sample_flags=None, sample_flags=None):
+    """trun with two samples; flags via first_sample_flags or per-sample records"""
+    flags = 0x01  # data_offset present
+    payload = struct.pack('>I', 2) + struct.pack('>i', 0)
+    if first_sample_flags is not None:
+        flags |= 0x04
+        payload += struct.pack('>I', first_sample_flags)
+    if sample_flags is not None:
+        flags |= 0x200 | 0x400
+        payload += b''.join(struct.pack('>II', 100, f) for f in sample_flags)
+    return box(b'trun', struct.pack('>I', flags) + payload)
+
+
+def keyframe_fmp4(tmp_path, video_trafs, trex_flags=None):
+    moov = trak(VIDEO_TRACK, 1000, b'vide') + trak(AUDIO_TRACK, 48000, b'soun')
+    if trex_flags is not None:
+        trex = full_box(b'trex', 0, struct.pack('>IIIII', VIDEO_TRACK, 1, 0, 0, trex_flags))
+        moov += box(b'mvex', trex)
+    data = box(b'ftyp', b'isom' + bytes(4)) + box(b'moov', moov)
+    for i, (tfhd_flags, tfhd_fields, run) in enumerate(video_trafs):
+        # Version 0, so the 32-bit word is just the tf_flags
+        tfhd = box(b'tfhd', struct.pack('>II', tfhd_flags, VIDEO_TRACK) + tfhd_fields)
+        video = box(b'traf', tfhd + full_box(b'tfdt', 1, struct.pack('>Q', i * 1000)) + run)
+        audio = traf(AUDIO_TRACK, i * 48000)
+        data += box(b'moof', video + audio) + box(b'mdat', bytes(16))
+    path = tmp_path / 'upload.mp4'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_starts_on_keyframes_from_first_sample_flags(tmp_path):
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(first_sample_flags=SYNC))] * 3)
+    assert fragment_index.starts_on_keyframes(path)
+
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(first_sample_flags=SYNC)), (0, b'', trun(first_sample_flags=NON_SYNC))])
+    assert not fragment_index.starts_on_keyframes(path)
+
+
+def test_starts_on_keyframes_from_per_sample_flags(tmp_path):
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(sample_flags=[SYNC, NON_SYNC]))])
+    assert fragment_index.starts_on_keyframes(path)
+
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(sample_flags=[NON_SYNC, SYNC]))])
+    assert not fragment_index.starts_on_keyframes(path)
+
+
+def test_starts_on_keyframes_from_default_flags(tmp_path):
+    # tfhd default_sample_flags (0x20), after a sample_description_index (0x02)
+    tfhd_fields = struct.pack('>II', 1, SYNC)
+    path = keyframe_fmp4(tmp_path, [(0x22, tfhd_fields, trun())])
+    assert fragment_index.starts_on_keyframes(path)
+
+    # Nothing in the fragment: trex decides
+    assert not fragment_index.starts_on_keyframes(keyframe_fmp4(tmp_path, [(0, b'', trun())], trex_flags=NON_SYNC))
+    assert fragment_index.starts_on_keyframes(keyframe_fmp4(tmp_path, [(0, b'', trun())], trex_flags=SYNC))
+    # No flags anywhere: unknown, so not trusted
+    assert not fragment_index.starts_on_keyframes(keyframe_fmp4(tmp_path, [(0, b'', trun())]))
+
+
+@pytest.fixture
+def ffmpeg_remux(monkeypatch):
+    calls = []
+
+    def fake_run(command, **kwargs):
+        calls.append(command)
+        with open(command[command.index('-i') + 1], 'rb') as src, open(command[-1], 'wb') as dst:
+            dst.write(src.read())
+
+    monkeypatch.setattr(fragment_index.subprocess, 'run', fake_run)
+    monkeypatch.setattr(fragment_index, 'probe_duration', lambda path: 3.0)
+    return calls
+
+
+def test_index_video_links_keyframe_aligned_uploads(tmp_path, ffmpeg_remux):
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(first_sample_flags=SYNC))] * 3)
+    fragment_index.index_video(path, str(tmp_path / 'chunks'))
+
+    assert ffmpeg_remux == []
+    media = tmp_path / 'chunks' / 'upload' / 'stream.mp4'
+    assert media.stat().st_ino == (tmp_path / 'upload.mp4').stat().st_ino
+
+
+def test_index_video_remuxes_fragments_cut_mid_gop(tmp_path, ffmpeg_remux):
+    path = keyframe_fmp4(tmp_path, [(0, b'', trun(first_sample_flags=SYNC)), (0, b'', trun(first_sample_flags=NON_SYNC))])
+    fragment_index.index_video(path, str(tmp_path / 'chunks'))
+
+    assert len(ffmpeg_remux) == 1
+    assert 'frag_keyframe' in ffmpeg_remux[0][ffmpeg_remux[0].index('-movflags') + 1]
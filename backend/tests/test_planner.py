@@ -0,0 +1,51 @@
+from splitting.planner import group_into_gops, plan_segments
+
+MB = 1024 * 1024
+
+
+def test_group_into_gops_attributes_packets_to_preceding_keyframe():
+    packets = [
+        (0.0, 100, True),
+        (0.04, 50, False),
+        (0.02, 30, False),   # audio muxed between video packets
+        (1.0, 200, True),
+        (1.02, 20, False)
+    ]
+    assert group_into_gops(packets) == [(0.0, 180), (1.0, 220)]
+
+
+def test_group_into_gops_leading_non_keyframes_form_a_gop():
+    assert group_into_gops([(0.0, 10, False), (0.5, 5, True)]) == [(0.0, 10), (0.5, 5)]
+    assert group_into_gops([]) == []
+
+
+def test_segments_stay_near_target_bytes():
+    gops = [(float(t), MB) for t in range(10)]
+    assert plan_segments(gops, 10.0, target_bytes=2 * MB) == [2.0, 4.0, 6.0, 8.0]
+
+
+def test_busy_scenes_get_shorter_segments():
+    # 1 s GOPs: 0.5 MB for the first 8 s, then 2 MB
+    gops = [(float(t), MB // 2 if t < 8 else 2 * MB) for t in range(12)]
+    boundaries = plan_segments(gops, 12.0, target_bytes=2 * MB)
+    assert boundaries == [4.0, 8.0, 10.0]
+
+
+def test_max_duration_closes_small_segments():
+    gops = [(float(t), 10) for t in range(20)]
+    assert plan_segments(gops, 20.0, target_bytes=2 * MB, max_duration=10.0) == [10.0]
+
+
+def test_min_duration_is_never_cut_short():
+    # Every 0.5 s GOP is over target on its own
+    gops = [(t * 0.5, 5 * MB) for t in range(9)]
+    assert plan_segments(gops, 4.5, target_bytes=2 * MB, min_duration=2.0) == [2.0, 4.0]
+
+
+def test_gop_longer_than_max_duration_is_its_own_segment():
+    gops = [(0.0, 10), (15.0, 10), (16.0, 10)]
+    assert plan_segments(gops, 17.0, max_duration=10.0) == [15.0]
+
+
+def test_no_gops():
+    assert plan_segments([], 0.0) == []
@@ -0,0 +1,228 @@
+"""
+Storage reaper passes over a tmp_path storage tree and a mongomock database
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from api import reaper as reaper_module
+from api.database import MongoDB
+from api.reaper import Reaper
+
+GRACE = 3600
+STALE = 6 * 3600
+
+
+@pytest.fixture
+def database():
+    database = MongoDB()
+    database._client = mongomock.MongoClient()
+    return database
+
+
+@pytest.fixture
+def storage(tmp_path):
+    videos_dir = tmp_path / 'videos'
+    chunks_dir = tmp_path / 'chunks'
+    videos_dir.mkdir()
+    chunks_dir.mkdir()
+    (videos_dir / '.gitkeep').touch()
+    (chunks_dir / '.gitkeep').touch()
+    return videos_dir, chunks_dir
+
+
+@pytest.fixture
+def reaper(database, storage):
+    videos_dir, chunks_dir = storage
+    return Reaper(
+        database=database,
+        videos_dir=str(videos_dir),
+        chunks_dir=str(chunks_dir),
+        grace_seconds=GRACE,
+        stale_seconds=STALE,
+        max_requeues=2,
+        ops_per_second=0
+    )
+
+
+def age(path, seconds=GRACE * 2):
+    """Backdate a file, or a directory and everything in it"""
+    stamp = time.time() - seconds
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            os.utime(os.path.join(root, name), (stamp, stamp))
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def old_file(path):
+    path.write_bytes(b'data')
+    return age(path)
+
+
+def old_dir(path, *files):
+    path.mkdir()
+    for name in files:
+        (path / name).write_bytes(b'data')
+    return age(path)
+
+
+def add_video(database, storage, video_id, status, idle, upload=True, chunks=True, **fields):
+    videos_dir, chunks_dir = storage
+    doc = {
+        'video_id': video_id,
+        'filename': f'{video_id}.mp4',
+        'status': status,
+        'requeues': 0,
+        'updated_at': datetime.utcnow() - timedelta(seconds=idle)
+    }
+    doc.update(fields)
+    database.videos.insert_one(doc)
+    if upload:
+        old_file(videos_dir / doc['filename'])
+    if chunks:
+        old_dir(chunks_dir / video_id, 'chunk_000.mp4')
+    return doc
+
+
+def test_orphans_and_temp_files_are_removed(reaper, database, storage):
+    videos_dir, chunks_dir = storage
+    add_video(database, storage, 'kept', 'ready', idle=GRACE * 2)
+    old_file(chunks_dir / 'kept' / 'manifest.json.tmp')
+    age(chunks_dir / 'kept')
+    old_dir(chunks_dir / 'orphan', 'chunk_000.mp4')
+    old_file(videos_dir / 'orphan.mp4')
+    old_dir(chunks_dir / '.kept.1234abcd.partial', 'chunk_000.mp4')
+    old_file(videos_dir / 'upload.mp4.part')
+
+    stats = reaper.run_once()
+
+    assert stats['orphan_chunk_dirs_removed'] == 1
+    assert stats['orphan_uploads_removed'] == 1
+    assert stats['staging_removed'] == 1
+    assert stats['temp_files_removed'] == 2
+    assert sorted(os.listdir(chunks_dir)) == ['.gitkeep', 'kept']
+    assert sorted(os.listdir(videos_dir)) == ['.gitkeep', 'kept.mp4']
+    assert os.listdir(chunks_dir / 'kept') == ['chunk_000.mp4']
+    assert database.get_video('kept')['status'] == 'ready'
+
+
+def test_files_younger_than_grace_are_kept(reaper, storage):
+    videos_dir, chunks_dir = storage
+    (chunks_dir / 'in-flight').mkdir()
+    (videos_dir / 'in-flight.mp4').write_bytes(b'video')
+    (videos_dir / 'in-flight.mp4.part').write_bytes(b'partial')
+    (chunks_dir / '.in-flight.1234abcd.partial').mkdir()
+
+    stats = reaper.run_once()
+
+    assert not any(stats.values())
+    assert len(os.listdir(chunks_dir)) == 3
+    assert len(os.listdir(videos_dir)) == 3
+
+
+def test_dotfiles_are_kept(reaper, storage):
+    videos_dir, chunks_dir = storage
+    age(videos_dir / '.gitkeep')
+    age(chunks_dir / '.gitkeep')
+
+    reaper.run_once()
+
+    assert (videos_dir / '.gitkeep').exists()
+    assert (chunks_dir / '.gitkeep').exists()
+
+
+def test_linked_duplicates_follow_their_source(reaper, database, storage):
+    add_video(database, storage, 'source', 'ready', idle=GRACE * 2)
+    add_video(database, storage, 'linked', 'ready', idle=GRACE * 2, upload=False, chunks=False,
+              filename='source.mp4', source_video_id='source')
+    add_video(database, storage, 'orphaned', 'ready', idle=GRACE * 2, upload=False, chunks=False,
+              filename='gone.mp4', source_video_id='gone')
+    add_video(database, storage, 'recent', 'ready', idle=0, upload=False, chunks=False,
+              filename='gone.mp4', source_video_id='gone')
+
+    stats = reaper.run_once()
+
+    assert stats['videos_deleted'] == 1
+    assert database.get_video('orphaned') is None
+    assert database.get_video('linked') is not None
+    assert database.get_video('recent') is not None
+    # Only the document: the shared files belong to the source
+    assert os.path.exists(storage[0] / 'source.mp4')
+    assert os.path.isdir(storage[1] / 'source')
+
+
+def test_failed_videos_are_requeued_until_out_of_requeues(reaper, database, storage):
+    add_video(database, storage, 'retry', 'failed', idle=GRACE * 2, requeues=1, error='boom')
+    add_video(database, storage, 'exhausted', 'failed', idle=GRACE * 2, requeues=2)
+    add_video(database, storage, 'no-source', 'failed', idle=GRACE * 2, upload=False)
+    add_video(database, storage, 'just-failed', 'failed', idle=0)
+
+    stats = reaper.run_once()
+
+    assert stats['videos_requeued'] == 1
+    assert stats['videos_deleted'] == 2
+    retry = database.get_video('retry')
+    assert (retry['status'], retry['requeues'], retry['requeued'], retry['error']) == ('uploaded', 2, True, None)
+    for video_id in ('exhausted', 'no-source'):
+        assert database.get_video(video_id) is None
+        assert not os.path.exists(storage[1] / video_id)
+    assert not os.path.exists(storage[0] / 'exhausted.mp4')
+    assert database.get_video('just-failed')['status'] == 'failed'
+
+
+def test_queue_mode_requeue_enqueues_a_job(reaper, database, storage, monkeypatch):
+    monkeypatch.setattr(reaper_module, 'PROCESSING_MODE', 'queue')
+    add_video(database, storage, 'retry', 'failed', idle=GRACE * 2)
+
+    reaper.run_once()
+
+    assert database.get_video('retry')['requeued'] is False
+    assert database.get_active_job('retry')['filename'] == 'retry.mp4'
+
+
+def test_stuck_videos_use_the_processing_heartbeat(reaper, database, storage):
+    recent = datetime.utcnow() - timedelta(seconds=60)
+    add_video(database, storage, 'alive', 'processing', idle=STALE * 2, heartbeat_at=recent)
+    add_video(database, storage, 'stuck', 'processing', idle=STALE * 2,
+              heartbeat_at=datetime.utcnow() - timedelta(seconds=STALE * 2))
+    add_video(database, storage, 'no-heartbeat', 'uploaded', idle=STALE * 2)
+    add_video(database, storage, 'slow', 'processing', idle=STALE // 2)
+    add_video(database, storage, 'queued', 'uploaded', idle=STALE * 2)
+    database.enqueue_job('queued', 'queued.mp4')
+    add_video(database, storage, 'waiting', 'uploaded', idle=STALE * 2, requeued=True, requeues=1)
+
+    stats = reaper.run_once()
+
+    assert stats['videos_requeued'] == 2
+    assert database.get_video('stuck')['requeued'] is True
+    assert database.get_video('no-heartbeat')['requeued'] is True
+    for video_id in ('alive', 'slow'):
+        assert database.get_video(video_id)['status'] == 'processing'
+    assert 'requeued' not in database.get_video('queued')
+    assert database.get_video('waiting')['requeues'] == 1
+
+
+def test_ready_videos_with_missing_chunks_are_requeued(reaper, database, storage):
+    add_video(database, storage, 'lost', 'ready', idle=GRACE * 2, chunks=False)
+
+    assert reaper.run_once()['videos_requeued'] == 1
+    assert database.get_video('lost')['status'] == 'uploaded'
+
+
+def test_dry_run_changes_nothing(reaper, database, storage):
+    videos_dir, chunks_dir = storage
+    add_video(database, storage, 'exhausted', 'failed', idle=GRACE * 2, requeues=2)
+    old_dir(chunks_dir / 'orphan')
+    reaper.dry_run = True
+
+    stats = reaper.run_once()
+
+    assert stats['videos_deleted'] == 1 and stats['orphan_chunk_dirs_removed'] == 1
+    assert database.get_video('exhausted') is not None
+    assert os.path.isdir(chunks_dir / 'orphan')
+    assert os.path.exists(videos_dir / 'exhausted.mp4')
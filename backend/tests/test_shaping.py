@@ -0,0 +1,102 @@
+import types
+
+import pytest
+
+from api import shaping
+from api.shaping import Shaper, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(shaping, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=100, burst=200, now=0.0)
+    bucket.take(150)
+    bucket.refill(1.0)
+    assert bucket.tokens == 150
+    bucket.refill(10.0)
+    assert bucket.tokens == 200
+
+
+def test_bucket_wait_time():
+    bucket = TokenBucket(rate=100, burst=200, now=0.0)
+    bucket.take(150)
+    assert bucket.wait_time(50) == 0
+    assert bucket.wait_time(100) == pytest.approx(0.5)
+    # With a floor, the bucket must stay above it after the take
+    assert bucket.wait_time(50, floor=100) == pytest.approx(1.0)
+
+
+def test_full_bucket_admits_more_than_burst():
+    bucket = TokenBucket(rate=100, burst=200, now=0.0)
+    assert bucket.wait_time(500) == 0
+    bucket.take(500)
+    # In debt: waits for the bucket to refill completely
+    assert bucket.wait_time(500) == pytest.approx(5.0)
+
+
+def test_disabled_by_default_rates():
+    assert not Shaper(global_rate=0, client_rate=0).enabled
+    assert Shaper(global_rate=0, client_rate=10).enabled
+
+
+def test_client_buckets_are_independent(clock):
+    shaper = Shaper(global_rate=0, client_rate=100, burst_seconds=2)
+    assert shaper.admit('a', 150) == 0
+    assert shaper.admit('a', 100) == pytest.approx(0.5)
+    assert shaper.admit('b', 150) == 0
+
+    clock.advance(0.5)
+    assert shaper.admit('a', 100) == 0
+
+
+def test_refused_requests_are_not_charged(clock):
+    shaper = Shaper(global_rate=0, client_rate=100, burst_seconds=2)
+    shaper.admit('a', 200)
+    for _ in range(5):
+        assert shaper.admit('a', 100) > 0
+    clock.advance(1.0)
+    assert shaper.admit('a', 100) == 0
+
+
+def test_prefetch_cannot_spend_the_urgent_reserve(clock):
+    # Global burst 2000, of which 500 is reserved for urgent chunks
+    shaper = Shaper(global_rate=1000, client_rate=0, burst_seconds=2, urgent_reserve=0.25)
+    assert shaper.admit('a', 1500) == 0
+    assert shaper.admit('b', 100) == pytest.approx(0.1)
+    assert shaper.admit('b', 400, urgent=True) == 0
+    assert shaper.admit('c', 200, urgent=True) > 0
+
+
+def test_urgent_may_overdraw_client_bucket_by_one_burst(clock):
+    shaper = Shaper(global_rate=0, client_rate=100, burst_seconds=2)
+    assert shaper.admit('a', 200) == 0
+    assert shaper.admit('a', 10) > 0
+    assert shaper.admit('a', 150, urgent=True) == 0
+    assert shaper.admit('a', 100, urgent=True) > 0
+    # The debt delays prefetch until the bucket is back above zero
+    assert shaper.admit('a', 10) == pytest.approx(1.6)
+
+
+def test_idle_clients_are_pruned(clock):
+    shaper = Shaper(global_rate=0, client_rate=100, burst_seconds=2)
+    shaper.admit('a', 100)
+    shaper.admit('b', 100)
+    clock.advance(shaping._PRUNE_INTERVAL)
+    shaper.admit('c', 100)
+    assert set(shaper._clients) == {'c'}
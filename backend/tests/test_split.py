@@ -0,0 +1,63 @@
+"""
+split_video's ffmpeg command for fixed and planned segmentation
+
+subprocess.run is replaced by a stand-in that records the command and
+writes one chunk file, so no ffmpeg is needed.
+"""
+import os
+
+import pytest
+
+from api.utils import generate_manifest
+from splitting import split
+
+
+@pytest.fixture
+def ffmpeg_calls(monkeypatch):
+    calls = []
+
+    def fake_run(command, **kwargs):
+        calls.append(command)
+        output_pattern = next(arg for arg in command if arg.endswith('chunk_%03d.mp4'))
+        with open(output_pattern % 0, 'wb') as f:
+            f.write(b'chunk')
+
+    monkeypatch.setattr(split.subprocess, 'run', fake_run)
+    return calls
+
+
+def segment_args(command):
+    i = command.index('segment')
+    return command[i + 1:i + 3]
+
+
+def test_fixed_duration_without_plan(tmp_path, ffmpeg_calls):
+    split.split_video(str(tmp_path / 'vid.mp4'), str(tmp_path / 'chunks'), chunk_duration=5)
+    assert segment_args(ffmpeg_calls[0]) == ['-segment_time', '5']
+
+
+def test_planned_boundaries_are_cut_just_before_keyframes(tmp_path, ffmpeg_calls):
+    split.split_video(str(tmp_path / 'vid.mp4'), str(tmp_path / 'chunks'), segment_times=[4.0, 8.5])
+    assert segment_args(ffmpeg_calls[0]) == ['-segment_times', '3.999,8.499']
+
+
+def test_empty_plan_is_one_segment(tmp_path, ffmpeg_calls):
+    # plan_segments returns [] for short clips; that must not fall back to 5 s chunks
+    split.split_video(str(tmp_path / 'vid.mp4'), str(tmp_path / 'chunks'), chunk_duration=5, segment_times=[])
+    flag, seconds = segment_args(ffmpeg_calls[0])
+    assert flag == '-segment_time'
+    assert float(seconds) > 24 * 3600
+
+
+def test_empty_plan_manifest_has_chunk_timing(tmp_path, ffmpeg_calls):
+    chunks_dir = str(tmp_path / 'chunks')
+    split.split_video(str(tmp_path / 'vid.mp4'), chunks_dir, segment_times=[])
+    plan = {'segment_times': [], 'duration': 7.5, 'target_bytes': 1024}
+
+    manifest = generate_manifest('vid', chunks_dir, segment_plan=plan)
+
+    assert manifest['segmentation'] == 'adaptive'
+    assert manifest['total_chunks'] == 1
+    assert manifest['chunks'][0]['start'] == 0.0
+    assert manifest['chunks'][0]['duration'] == 7.5
+    assert os.path.exists(os.path.join(chunks_dir, 'vid', 'chunk_000.mp4'))
@@ -0,0 +1,31 @@
+from api.utils import plan_virtual_chunks
+
+
+def index_with_times(times):
+    return {'fragments': [{'offset': i * 100, 'size': 100, 'time': t} for i, t in enumerate(times)]}
+
+
+def test_cuts_at_first_keyframe_after_each_boundary():
+    index = index_with_times([0.0, 2.0, 4.0, 5.5, 6.0, 8.0, 10.0, 11.0])
+    assert plan_virtual_chunks(index, 5) == [
+        (0, 2, 0.0),    # 0, 2, 4
+        (3, 5, 5.5),    # 5.5 is the first keyframe at or after 5
+        (6, 7, 10.0)
+    ]
+
+
+def test_long_gop_skips_boundaries():
+    # A 12 s gap crosses two 5 s boundaries; the next chunk starts after it
+    index = index_with_times([0.0, 12.0, 14.0, 15.0])
+    assert plan_virtual_chunks(index, 5) == [(0, 0, 0.0), (1, 2, 12.0), (3, 3, 15.0)]
+
+
+def test_every_fragment_is_in_exactly_one_chunk():
+    times = [i * 0.8 for i in range(50)]
+    groups = plan_virtual_chunks(index_with_times(times), 3)
+    covered = [i for first, last, _ in groups for i in range(first, last + 1)]
+    assert covered == list(range(len(times)))
+
+
+def test_empty_index():
+    assert plan_virtual_chunks(index_with_times([]), 5) == []
@@ -0,0 +1,143 @@
+"""
+StreamSwarm split worker
+
+Claims processing jobs from the MongoDB `jobs` collection, runs split +
+manifest for each one and writes the results to shared storage
+(VIDEOS_DIR / CHUNKS_DIR must point at the same volume on every node).
+Run as many workers as needed, on as many machines as needed; each job
+is held under a lease that is renewed by heartbeats, so jobs from a
+crashed or stalled worker are picked up again once the lease expires.
+
+Start the API with PROCESSING_MODE=queue so uploads are handed to workers.
+
+Usage:
+    python worker.py
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from api.database import db
+from api.metrics import StageTimer
+from api.pipeline import VIDEOS_DIR, ProcessingCancelled, process_video, mark_failed
+
+WORKER_ID = os.getenv('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', 60))
+POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 2))
+MAX_ATTEMPTS = int(os.getenv('WORKER_MAX_ATTEMPTS', 3))
+MAX_BACKOFF = float(os.getenv('WORKER_MAX_BACKOFF', 60))
+
+
+class Heartbeat(threading.Thread):
+    """Renews a job lease until stopped"""
+
+    def __init__(self, job_id):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.stopped = threading.Event()
+        self.revoked = False
+        # Local view of the lease; renewed on every successful heartbeat
+        self.valid_until = time.monotonic() + LEASE_SECONDS
+
+    @property
+    def lost(self):
+        """True once another worker may own the job: revoked, or not renewed in time"""
+        return self.revoked or time.monotonic() >= self.valid_until
+
+    def run(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3):
+            renewed_at = time.monotonic()
+            try:
+                if not db.heartbeat_job(self.job_id, WORKER_ID, LEASE_SECONDS):
+                    print(f"⚠️  Lost lease on job {self.job_id}")
+                    self.revoked = True
+                    return
+                self.valid_until = renewed_at + LEASE_SECONDS
+            except Exception as e:
+                # Transient DB errors: keep trying until the lease runs out
+                print(f"⚠️  Heartbeat failed for job {self.job_id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """Process one claimed job and record the outcome"""
+    video_id = job['video_id']
+    video_path = os.path.join(VIDEOS_DIR, job['filename'])
+    timer = StageTimer()
+    timer.timings.update(job.get('stage_timings', {}))
+
+    print(f"📥 [{WORKER_ID}] Claimed job for {video_id} (attempt {job['attempts']}/{MAX_ATTEMPTS})")
+    heartbeat = Heartbeat(job['_id'])
+    heartbeat.start()
+    try:
+        # Once the lease is gone another worker may be processing this job;
+        # stop before writing chunks or status so the two don't interleave
+        process_video(video_id, video_path, timer, cancelled=lambda: heartbeat.lost)
+    except ProcessingCancelled as e:
+        heartbeat.stop()
+        print(f"⚠️  {e}: lease on the job was lost")
+        return
+    except Exception as e:
+        heartbeat.stop()
+        print(f"❌ Processing failed for {video_id}: {str(e)}")
+        traceback.print_exc()
+        retry = job['attempts'] < MAX_ATTEMPTS
+        if not db.fail_job(job['_id'], WORKER_ID, e, retry):
+            print(f"⚠️  Job for {video_id} failed after its lease was taken over")
+        elif retry:
+            db.update_video_status(video_id, 'uploaded', error=str(e))
+        else:
+            mark_failed(video_id, e, timer)
+        return
+
+    heartbeat.stop()
+    if not db.complete_job(job['_id'], WORKER_ID):
+        print(f"⚠️  Job for {video_id} finished after its lease was taken over")
+
+
+def main():
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n🛑 [{WORKER_ID}] Stopping after the current job...")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"👷 Worker {WORKER_ID} started (lease {LEASE_SECONDS}s, max attempts {MAX_ATTEMPTS})")
+    backoff = POLL_INTERVAL
+    while not stopping.is_set():
+        try:
+            for video_id in db.expire_abandoned_jobs(MAX_ATTEMPTS):
+                print(f"❌ Giving up on {video_id}: lease expired {MAX_ATTEMPTS} times")
+                mark_failed(video_id, 'Processing abandoned after repeated worker failures')
+
+            job = db.claim_job(WORKER_ID, LEASE_SECONDS, MAX_ATTEMPTS)
+            backoff = POLL_INTERVAL
+            if job is None:
+                stopping.wait(POLL_INTERVAL)
+                continue
+            run_job(job)
+        except Exception as e:
+            # Transient MongoDB errors must not kill the worker; a job whose
+            # outcome couldn't be recorded is retried once its lease expires
+            print(f"⚠️  [{WORKER_ID}] Error in worker loop, retrying in {backoff:g}s: {e}")
+            traceback.print_exc()
+            stopping.wait(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    print(f"👋 Worker {WORKER_ID} stopped")
+
+
+if __name__ == '__main__':
+    main()